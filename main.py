@@ -2,89 +2,111 @@
 # -*- coding: utf-8 -*-
 
 # Main script to run StateSim
+#
+#   python main.py --config config.yaml --sweep sweep.yaml \
+#       --shard-index 0 --shard-count 10 --output-dir ./data --workers 4
 
 # TODO: Config logger
 
-from datetime import datetime
-from itertools import product
-import json
+import argparse
 import logging
-import random
+import os
+import socket
 import sys
 import yaml
 
-import pandas as pd
-
-from statesim.system import InternationalSystem
-from statesim.sim import Simulation
-from statesim.state import State
+from statesim.budget import Budget
+from statesim.queue import WorkQueue
+from statesim.summary import SweepSummary
+from statesim.sweep import expand_sweep, run_configs, shard, work_processes
+from statesim.templates import WorldTemplates
 
 logging.basicConfig(stream=sys.stdout,
                     level=logging.INFO,
                     format='%(levelname)s | %(asctime)s | %(name)s | %(''message)s',
                     datefmt='%Y-%m-%d %H:%M:%S')
 
-def expand_grid(dictionary):
-    """ Quick function similar to expand.grid in R, used to create a
-    config matrix"""
-    return pd.DataFrame([row for row in product(*dictionary.values())], 
-                        columns=dictionary.keys())
-
-
-if __name__ == '__main__':
-
-    # Set up matrix of config options
-    config_dict = {'seed': [1804],
-               'niter': [1000],
-               'network_n': [98],
-               'network_p': [8],
-               'power_dist_mu': [10.0],
-               'power_dist_sigma': [1.67, 3.33, 6.67],
-               'misperception_sigma': [0.1, 0.2, 0.4],
-               'victory_sigma': [1.0, 3.0, 5.0],
-               'max_war_cost': [0.05, 0.1, 0.2],
-               'war_cost_disp': [0.05, 0.10, 0.15],
-               'reparations': [0.1, 0.2, 0.3],
-               'growth_mu': [0.005, 0.01, 0.03],
-               'growth_sigma': [0.01, 0.025, 0.05],
-               'versailles': [True, False]}
-    configs = expand_grid(config_dict)
-
-    # Randomize configs
-    configs = configs.sample(frac=1).reset_index(drop=True)
-
-    # Iterate over each config setting
-    for config in configs.to_dict(orient='row'):
-
-        config['seed'] = random.randint(1, 10e6)
 
-        SIM_ID = datetime.now().strftime('%Y%m%dt%H%M%S')
+def load_yaml(path):
+    with open(path) as f:
+        return yaml.safe_load(f)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Run a StateSim sweep')
+    parser.add_argument('--config', default='config.yaml',
+                        help='base config, YAML')
+    parser.add_argument('--sweep', help='sweep specification, YAML: a grid of '
+                        'parameter values applied to the base config, and '
+                        'optionally a number of replicates; without it, the '
+                        'base config is run once')
+    parser.add_argument('--shard-index', type=int, default=0)
+    parser.add_argument('--shard-count', type=int, default=1)
+    parser.add_argument('--output-dir', default='./data')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='worker processes; in queue mode, each works on '
+                        'the queue as worker <worker-id>-<i>')
+    parser.add_argument('--queue', help='SQLite work queue shared by several '
+                        'workers; the shard is enqueued once, then worked on')
+    parser.add_argument('--worker-id', default='%s-%s' % (socket.gethostname(), os.getpid()))
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--lease-timeout', type=float, default=300.0)
+    parser.add_argument('--max-attempts', type=int, default=3,
+                        help='claims of a config whose lease keeps expiring, '
+                        'e.g. because it crashes its worker, before it is '
+                        'failed')
+    parser.add_argument('--template-dir', help='directory of cached world '
+                        'maps, shared between workers')
+    parser.add_argument('--template-max-files', type=int, default=1024,
+                        help='maps kept in --template-dir; least recently '
+                        'used are deleted')
+    parser.add_argument('--summary', help='JSON file of running per-config '
+                        'summaries; in queue mode, one file per worker')
+    parser.add_argument('--records-only', action='store_true',
+                        help='save compact run records to replay instead of '
+                        'full outputs')
+    parser.add_argument('--max-seconds', type=float,
+                        help='wall time allowed per simulation')
+    parser.add_argument('--max-turns', type=int,
+                        help='turns allowed per simulation')
+    parser.add_argument('--max-memory-mb', type=float,
+                        help='memory growth allowed per simulation')
+    return parser.parse_args(argv)
 
-        try:
 
-            sim = Simulation(config=config)
-            sim.run()
-
-            # Save config
-            config['sim_id'] = SIM_ID
-            with open('./data/config/config_%s.json' % SIM_ID, 'w+') as f:
-                f.write(json.dumps(config))
-
-            # Save simulation results
-            sim.state['sim_id'] = SIM_ID
-            sim.system['sim_id'] = SIM_ID
-            sim.wars['sim_id'] = SIM_ID
-
-            sim.state.to_csv('./data/state/state_%s.csv' % SIM_ID, index=False)
-            sim.system.to_csv('./data/system/system_%s.csv' % SIM_ID, index=False)
-            sim.wars.to_csv('./data/wars/wars_%s.csv' % SIM_ID, index=False)
-
-        except:
-
-            # Save config as error, and resume simulation
-            config['sim_id'] = SIM_ID
-            with open('./data/error/config_%s.json' % SIM_ID, 'w+') as f:
-                f.write(json.dumps(config))
-
-            continue
+if __name__ == '__main__':
 
+    args = parse_args()
+
+    base = load_yaml(args.config)
+    spec = load_yaml(args.sweep) if args.sweep else {}
+    prefix = os.path.splitext(os.path.basename(args.sweep or args.config))[0]
+
+    # Every job expands the same sweep, then keeps only its own shard
+    configs = shard(expand_sweep(base, spec), args.shard_index, args.shard_count)
+    logging.info('Shard %s of %s: %s configs' % (args.shard_index, args.shard_count,
+                                                 len(configs)))
+
+    templates = WorldTemplates(directory=args.template_dir,
+                               max_files=args.template_max_files)
+    budget = Budget(max_seconds=args.max_seconds, max_turns=args.max_turns,
+                    max_memory_mb=args.max_memory_mb)
+
+    if args.queue:
+        queue = WorkQueue(args.queue, lease_timeout=args.lease_timeout,
+                          max_attempts=args.max_attempts)
+        queue.enqueue([config for i, config in configs])
+        queue.close()
+
+        work_processes(args.queue, args.worker_id, workers=args.workers,
+                       templates=templates, summary_path=args.summary,
+                       output_dir=args.output_dir, batch_size=args.batch_size,
+                       lease_timeout=args.lease_timeout,
+                       records_only=args.records_only, budget=budget,
+                       max_attempts=args.max_attempts)
+    else:
+        summary = SweepSummary(path=args.summary) if args.summary else None
+        run_configs([('%s_%06d' % (prefix, i), config) for i, config in configs],
+                    output_dir=args.output_dir, workers=args.workers,
+                    templates=templates, summary=summary,
+                    records_only=args.records_only, budget=budget)
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import fnmatch
+import glob
+import io
+import json
+import logging
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+from scipy import optimize, stats
+
+logger = logging.getLogger(__name__)
+
+# Survival analysis of sweep outputs: state lifetimes and system durations,
+# right-censored at the last turn played, with Kaplan-Meier estimates,
+# exponential and Weibull fits, and Weibull regression on config parameters.
+# Every estimator works on whole arrays, so millions of lifetimes are fitted
+# in seconds.
+
+
+def read_files(directory, pattern):
+    """ Yields (name, bytes) for each file in directory matching pattern,
+    including those inside zip archives there, as the paper's data ship.
+    """
+    for path in sorted(glob.glob(os.path.join(directory, pattern))):
+        with open(path, 'rb') as f:
+            yield os.path.basename(path), f.read()
+
+    # Skip the resource forks macOS adds to archives
+    for path in sorted(glob.glob(os.path.join(directory, '*.zip'))):
+        with zipfile.ZipFile(path) as z:
+            for name in sorted(z.namelist()):
+                if not name.startswith('__MACOSX') and \
+                        fnmatch.fnmatch(os.path.basename(name), pattern):
+                    yield os.path.basename(name), z.read(name)
+
+
+def load_configs(output_dir='./data'):
+    """ Returns the configs of all simulations in output_dir, one row per
+    sim_id.
+    """
+    configs = [json.loads(data) for name, data in
+               read_files(os.path.join(output_dir, 'config'), 'config_*.json')]
+    configs = pd.DataFrame(configs)
+    for name in ['cancelled', 'turns']:
+        if name not in configs:
+            configs[name] = np.nan
+    return configs.set_index('sim_id')
+
+
+def load_csvs(output_dir, name, usecols=None):
+    """ Concatenates the name data sets (state, system or wars) of all
+    simulations in output_dir.
+    """
+    # A run without deaths writes a state data set with no columns but sim_id
+    keep = None if usecols is None else lambda c: c in usecols
+    frames = [pd.read_csv(io.BytesIO(data), usecols=keep) for _, data in
+              read_files(os.path.join(output_dir, name), '%s_*.csv' % name)]
+    frames = [i for i in frames if len(i)]
+    if not frames:
+        return None
+    return pd.concat(frames, ignore_index=True)
+
+
+def final_turns(configs, states, systems=None):
+    """ Returns the turn each simulation ended on, as Simulation.world.turn,
+    indexed by sim_id: the turn after the last death for a run that ended in
+    a universal empire, at most niter - 1, and niter - 1 for any other.
+
+    A run cancelled over budget ended on the turn recorded in its config as
+    turns. Outputs saved before it was recorded are taken to end on their
+    last turn in the system data set, which misses the last turns if they
+    saw no encounter, or else their last death.
+    """
+    deaths = states.groupby('sim_id')['survived_to'].agg(['size', 'max'])
+    deaths = deaths.reindex(configs.index, fill_value=0)
+
+    survivors = configs['network_n'] - deaths['size']
+    # A universal empire formed on the last turn is not found before the run
+    # ends
+    last = pd.Series(np.where(survivors == 1,
+                              np.minimum(deaths['max'] + 1, configs['niter'] - 1),
+                              configs['niter'] - 1),
+                     index=configs.index)
+
+    cancelled = configs['cancelled'].notna()
+    if cancelled.any():
+        played = deaths['max'][cancelled]
+        if systems is not None:
+            played = np.maximum(played, systems.groupby('sim_id')['turn'].max()
+                                .reindex(played.index, fill_value=0))
+        if 'turns' in configs:
+            played = configs['turns'][cancelled].fillna(played)
+        last[cancelled] = played
+
+    return last.astype(int)
+
+
+def state_lifetimes(configs, states, systems=None):
+    """ Returns one row per state of every simulation: its lifetime in turns,
+    and event, True if it died and False if it survived to the end of the run
+    and is censored there. States that survived are not in the state data
+    set, so their number is inferred from network_n.
+    """
+    last = final_turns(configs, states, systems)
+    deaths = states.groupby('sim_id').size().reindex(configs.index, fill_value=0)
+    survivors = (configs['network_n'] - deaths).values
+
+    dead = pd.DataFrame({'sim_id': states['sim_id'].values,
+                         'time': states['survived_to'].values,
+                         'event': True})
+    censored = pd.DataFrame({'sim_id': np.repeat(configs.index.values, survivors),
+                             'time': np.repeat(last.values, survivors),
+                             'event': False})
+    return pd.concat([dead, censored], ignore_index=True)
+
+
+def system_durations(configs, states, systems=None):
+    """ Returns one row per simulation: the duration of its system in turns,
+    and event, True if it ended in a universal empire and False if it is
+    censored at the end of the run.
+    """
+    last = final_turns(configs, states, systems)
+    deaths = states.groupby('sim_id').size().reindex(configs.index, fill_value=0)
+    return pd.DataFrame({'sim_id': configs.index.values,
+                         'time': last.values,
+                         'event': (configs['network_n'] - deaths).values == 1})
+
+
+def load_lifetimes(output_dir='./data'):
+    """ Reads a sweep's outputs and returns its configs, state lifetimes and
+    system durations.
+    """
+    configs = load_configs(output_dir)
+    states = load_csvs(output_dir, 'state', usecols=['survived_to', 'sim_id'])
+    if states is None:
+        states = pd.DataFrame({'survived_to': [], 'sim_id': []})
+    systems = load_csvs(output_dir, 'system', usecols=['turn', 'sim_id'])
+    logger.info('Loaded %s simulations, %s state deaths'
+                % (len(configs), len(states)))
+    return (configs, state_lifetimes(configs, states, systems),
+            system_durations(configs, states, systems))
+
+
+def kaplan_meier(time, event):
+    """ Kaplan-Meier estimate of the survival function of right-censored
+    lifetimes, with event True where the lifetime ended in death. Returns a
+    DataFrame with one row per distinct time: number at risk, deaths,
+    survival and its Greenwood standard error.
+    """
+    time = np.asarray(time)
+    event = np.asarray(event, dtype=bool)
+
+    times, ix = np.unique(time, return_inverse=True)
+    deaths = np.bincount(ix, weights=event, minlength=len(times))
+    leaving = np.bincount(ix, minlength=len(times))
+    at_risk = leaving[::-1].cumsum()[::-1]
+
+    survival = np.cumprod(1 - deaths / at_risk)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        greenwood = np.cumsum(deaths / (at_risk * (at_risk - deaths)))
+    se = survival * np.sqrt(greenwood)
+
+    return pd.DataFrame({'time': times,
+                         'at_risk': at_risk,
+                         'deaths': deaths.astype(int),
+                         'survival': survival,
+                         'se': se})
+
+
+def fit_exponential(time, event):
+    """ Maximum-likelihood exponential fit of right-censored lifetimes.
+    Returns the hazard rate per turn, its standard error, the mean lifetime
+    and the log-likelihood.
+    """
+    time = np.asarray(time, dtype=float)
+    d = np.sum(event)
+    exposure = time.sum()
+    rate = d / exposure
+    return {'rate': rate,
+            'se': np.sqrt(d) / exposure,
+            'mean': 1 / rate,
+            'loglik': d * np.log(rate) - rate * exposure}
+
+
+def fit_weibull(time, event):
+    """ Maximum-likelihood Weibull fit of right-censored lifetimes, with
+    survival function exp(-(t / scale) ** shape). For a given shape the
+    scale has a closed form, so only the shape is searched for, over the
+    profile likelihood. A shape above 1 means the hazard of death rises with
+    age. Returns shape, scale, median lifetime and log-likelihood.
+    """
+    time = np.asarray(time, dtype=float)
+    event = np.asarray(event, dtype=bool)
+    d = event.sum()
+
+    # Rescale, so that powers of large lifetimes do not overflow
+    unit = time.mean()
+    logt = np.log(time / unit)
+    sum_logt = logt[event].sum()
+
+    def profile(log_shape):
+        k = np.exp(log_shape)
+        return -(d * np.log(k) - d * np.log(np.exp(k * logt).sum() / d)
+                 + (k - 1) * sum_logt - d)
+
+    log_shape = optimize.minimize_scalar(profile, bounds=(-5, 5), method='bounded').x
+    shape = np.exp(log_shape)
+    scale = unit * (np.exp(shape * logt).sum() / d) ** (1 / shape)
+
+    return {'shape': shape,
+            'scale': scale,
+            'median': scale * np.log(2) ** (1 / shape),
+            'loglik': -profile(log_shape) - d * np.log(unit)}
+
+
+def weibull_regression(time, event, covariates):
+    """ Weibull accelerated failure time regression of right-censored
+    lifetimes on covariates, e.g. config parameters:
+
+        log(time) = intercept + covariates * coef + sigma * W
+
+    with W standard minimum extreme value, i.e. Weibull shape 1 / sigma. A
+    positive coefficient lengthens lifetimes. Fitted by Newton's method with
+    the analytic gradient and Hessian, which also give standard errors. The
+    log-likelihood is averaged over lifetimes, so the convergence tolerance
+    does not depend on the sample size.
+
+    Parameters
+    ----------
+    covariates : DataFrame
+        one column per covariate, one row per lifetime
+
+    Returns a DataFrame of coefficients, with standard errors, z statistics
+    and p-values, and rows for the intercept and log(sigma).
+    """
+    y = np.log(np.asarray(time, dtype=float))
+    e = np.asarray(event, dtype=float)
+    d = e.sum()
+    X = np.column_stack([np.ones(len(y)), covariates.values.astype(float)])
+    names = ['intercept'] + list(covariates.columns)
+    n, p = X.shape
+
+    def nll(params):
+        beta, u = params[:p], params[p]
+        sigma = np.exp(u)
+        z = (y - X.dot(beta)) / sigma
+        ez = np.exp(z)
+        value = -(e * z).sum() + d * u + (e * y).sum() + ez.sum()
+
+        a = X.T.dot(e - ez)
+        grad = np.append(a / sigma, (e * z).sum() + d - (ez * z).sum())
+
+        hess = np.empty((p + 1, p + 1))
+        hess[:p, :p] = (X.T * ez).dot(X) / sigma ** 2
+        hess[:p, p] = hess[p, :p] = (X.T.dot(ez * z) - a) / sigma
+        hess[p, p] = -(e * z).sum() + (ez * (z ** 2 + z)).sum()
+        return value / n, grad / n, hess / n
+
+    # Start from least squares on log lifetimes
+    start = np.append(np.linalg.lstsq(X, y, rcond=None)[0], 0.0)
+    result = optimize.minimize(lambda x: nll(x)[:2], start, jac=True,
+                               hess=lambda x: nll(x)[2], method='trust-exact')
+    # trust-exact can stop short of its tolerance at the optimum, reporting
+    # failure to predict improvement, so convergence is judged instead by the
+    # Newton decrement: the gain in mean log-likelihood a further Newton step
+    # would make, which, unlike the gradient, does not depend on the scale of
+    # the covariates
+    _, grad, hess = nll(result.x)
+    cov = np.linalg.inv(hess)
+    if grad.dot(cov).dot(grad) / 2 > 1e-10:
+        logger.warning('Weibull regression did not converge: %s' % result.message)
+
+    se = np.sqrt(np.diag(cov) / n)
+    coef = result.x
+    z = coef / se
+    return pd.DataFrame({'coef': coef,
+                         'se': se,
+                         'z': z,
+                         'p': 2 * stats.norm.sf(np.abs(z))},
+                        index=names + ['log_sigma'])
+
+
+def fit_by_config(lifetimes, configs, by):
+    """ Fits exponential and Weibull models to the lifetimes of each
+    combination of the config parameters by, e.g. a sweep's grid, or a
+    single parameter. Returns a DataFrame with one row per combination.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    data = lifetimes.join(configs[by], on='sim_id')
+    rows = []
+    for key, group in data.groupby(by):
+        # Older pandas yields scalar keys when grouping by a single column
+        key = key if isinstance(key, tuple) else (key,)
+        exponential = fit_exponential(group['time'], group['event'])
+        weibull = fit_weibull(group['time'], group['event'])
+        row = dict(zip(by, key))
+        row.update({'n': len(group),
+                    'deaths': int(group['event'].sum()),
+                    'rate': exponential['rate'],
+                    'shape': weibull['shape'],
+                    'scale': weibull['scale'],
+                    'median': weibull['median']})
+        rows.append(row)
+    return pd.DataFrame(rows)
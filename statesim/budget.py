@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import resource
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class BudgetExceeded(Exception):
+    """ Raised when a simulation runs over its Budget.
+    """
+
+    def __init__(self, reason):
+        super(BudgetExceeded, self).__init__(reason)
+        self.reason = reason
+
+
+def memory_mb():
+    """ Returns the resident memory of this process in megabytes. Falls back
+    to the peak resident memory where /proc is not available.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 2.0 ** 20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2.0 ** 10
+
+
+class Budget(object):
+    """ Wall-time, turn and memory limits on a single simulation, checked
+    cooperatively by Simulation.run at the end of every turn. A simulation
+    over budget is cancelled and keeps its results up to that turn.
+
+    Attributes
+    ----------
+    max_seconds : float or None
+        wall time allowed for the run
+    max_turns : int or None
+        turns allowed for the run, regardless of niter
+    max_memory_mb : float or None
+        growth in resident memory of the process allowed during the run
+    """
+
+    def __init__(self, max_seconds=None, max_turns=None, max_memory_mb=None):
+        self.max_seconds = max_seconds
+        self.max_turns = max_turns
+        self.max_memory_mb = max_memory_mb
+        self.start()
+
+    def start(self):
+        """ Starts the clock and takes the memory baseline for a new run.
+        """
+        self.started = time.monotonic()
+        self.memory0 = memory_mb() if self.max_memory_mb is not None else None
+
+    def check(self, turn):
+        """ Raises BudgetExceeded, giving the reason, if the run is over any
+        of its limits after turn.
+        """
+        if self.max_turns is not None and turn >= self.max_turns:
+            raise BudgetExceeded('turns: reached %s turns' % turn)
+
+        if self.max_seconds is not None:
+            elapsed = time.monotonic() - self.started
+            if elapsed > self.max_seconds:
+                raise BudgetExceeded('time: %.1f seconds at turn %s' % (elapsed, turn))
+
+        if self.max_memory_mb is not None:
+            used = memory_mb() - self.memory0
+            if used > self.max_memory_mb:
+                raise BudgetExceeded('memory: %.0f MB at turn %s' % (used, turn))
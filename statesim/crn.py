@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+
+import numpy as np
+from scipy import stats
+
+from statesim.sim import Simulation
+
+logger = logging.getLogger(__name__)
+
+# Common-random-numbers (CRN) comparisons: paired configs that differ in one
+# parameter are run with the same seed and crn set, so that they draw from
+# the same RandomStreams
+
+
+def paired_configs(config, param, values, seeds):
+    """ Returns pairs of configs for a CRN comparison: for each seed, config
+    with param set to each of the two values.
+    """
+    a, b = values
+    return [(dict(config, seed=seed, crn=True, **{param: a}),
+             dict(config, seed=seed, crn=True, **{param: b}))
+            for seed in seeds]
+
+
+def paired_difference(a, b, alpha=0.05):
+    """ Estimates the mean of b - a from paired observations, e.g. a metric
+    of paired CRN runs. Returns a dict with the number of pairs, mean
+    difference, its standard error, a 1 - alpha confidence interval, and the
+    p-value of a paired t-test; these are nan with fewer than two pairs.
+    """
+    d = np.asarray(b, dtype=float) - np.asarray(a, dtype=float)
+    n = len(d)
+    mean = np.mean(d)
+    se = np.std(d, ddof=1) / np.sqrt(n) if n > 1 else np.nan
+    t = stats.t.ppf(1 - alpha / 2, n - 1) if n > 1 else np.nan
+    if n < 2:
+        # A single pair says nothing about the spread of the difference
+        p = np.nan
+    elif se > 0:
+        p = 2 * stats.t.sf(abs(mean / se), n - 1)
+    else:
+        p = 1.0 if mean == 0 else 0.0
+    return {'n': n,
+            'diff': float(mean),
+            'se': float(se),
+            'lower': float(mean - t * se),
+            'upper': float(mean + t * se),
+            'p': float(p)}
+
+
+def compare(config, param, values, seeds, metric, alpha=0.05):
+    """ Runs paired CRN simulations of config with param set to each of the
+    two values, one pair per seed, and returns the paired_difference of
+    metric, a function of a finished Simulation.
+    """
+    a, b = [], []
+    for config_a, config_b in paired_configs(config, param, values, seeds):
+        for pair_config, results in [(config_a, a), (config_b, b)]:
+            sim = Simulation(config=pair_config)
+            sim.run()
+            results.append(metric(sim))
+    return paired_difference(a, b, alpha)
@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from collections import deque
+import copy
+import logging
+import multiprocessing
+import random
+
+import numpy as np
+from scipy.stats import cauchy
+
+from statesim.sim import Simulation
+from statesim.state import State
+from statesim.system import InternationalSystem
+
+logger = logging.getLogger(__name__)
+
+
+def partition_regions(network, n_regions, seed=None):
+    """ Splits the map into n_regions contiguous regions, grown breadth-first
+    from randomly chosen states. Returns a dict of state to region.
+    """
+    nodes = sorted(network.nodes)
+    rng = random.Random(seed)
+    sources = rng.sample(nodes, min(n_regions, len(nodes)))
+
+    region = {j: i for i, j in enumerate(sources)}
+    frontier = deque(sources)
+    while frontier:
+        u = frontier.popleft()
+        for v in network.neighbors(u):
+            if v not in region:
+                region[v] = region[u]
+                frontier.append(v)
+
+    # States cut off from every source
+    for v in nodes:
+        if v not in region:
+            region[v] = rng.randrange(n_regions)
+
+    return region
+
+
+def region_turn(task):
+    """ Resolves one region's encounters for a turn, apart from the rest of
+    the world, and assesses their war damage.
+
+    task holds the config, turn, a seed for the turn and the region; every
+    participating state's name, power, power0, misperception and, for
+    initiating and targeted states, border; and the (initiator, target)
+    pairs. Returns the new power of every participant, the conqueror of every
+    state below the power threshold, and the war data set records, all by
+    state name.
+    """
+    config, turn, seed, region, states, encounters = task
+
+    # Draws depend only on the turn's seed and the region, not on which
+    # process resolves the region; the caller's stream is left as it was
+    rng_state = np.random.get_state()
+    np.random.seed(np.random.SeedSequence([seed, region]).generate_state(4))
+    try:
+        return _region_turn(config, turn, states, encounters)
+    finally:
+        np.random.set_state(rng_state)
+
+
+def _region_turn(config, turn, states, encounters):
+
+    world = {}
+    for name, power, power0, misperception, border in states:
+        state = State(name=name, power=power, misperception=misperception)
+        state.power0 = power0
+        world[name] = state
+    for name, power, power0, misperception, border in states:
+        if border is not None:
+            world[name].border = [world[j] for j in border]
+
+    sim = Simulation(config=config)
+    sim.world = InternationalSystem.from_states(config, turn, world)
+
+    wars = []
+    for a, b in encounters:
+        war = sim.encounter(world[a], world[b])
+        if war is not None:
+            wars.append(war)
+    if wars:
+        sim.world.assess_war_damage_batch(wars)
+
+    power = {k: v.power for k, v in world.items()}
+    conquered = {k: v.conquered.name for k, v in sim.world.below_threshold.items()}
+    return power, conquered, sim.world.wars
+
+
+class PartitionedSimulation(Simulation):
+    """ Simulation of very large worlds across cores.
+
+    The map is split into regions. Each turn, as in concurrent mode, up to
+    concurrency initiating states are picked, and encounters whose
+    participants overlap one already accepted are dropped. Since accepted
+    encounters share no states, each is resolved apart from the others, by
+    the worker process handling its initiator's region, one task per region.
+    Power, deaths and war records are reconciled in this process, and the
+    turn is ended with growth and perception errors drawn for all states at
+    once and borders redrawn only where the map changed. Regions are redrawn
+    every repartition turns, as conquests change the map.
+
+    Regional encounters draw from a stream seeded by the turn, drawn from
+    the simulation's own, and region, so results do not depend on the number
+    of workers. The engine draws random numbers in a different order than
+    Simulation, and does not support CRN streams: configs with crn set are
+    rejected.
+
+    Config parameters: concurrency (required, above 1), regions (default 8)
+    and repartition (default 100).
+    """
+
+    def __init__(self, config, templates=None, budget=None, workers=1):
+        """
+        Parameters
+        ----------
+        workers : int
+            worker processes; with 1, regions are resolved in this process
+        """
+        super(PartitionedSimulation, self).__init__(config, templates=templates,
+                                                    budget=budget)
+        self.workers = workers
+        self.pool = None
+        self.regions = None
+        self.partitioned = None
+
+    def run(self):
+        if self.config.get('concurrency', 1) <= 1:
+            raise ValueError('Partitioned execution requires concurrency above 1')
+        if self.config.get('crn'):
+            raise ValueError('Partitioned execution does not support CRN streams')
+
+        if self.workers > 1:
+            self.pool = multiprocessing.Pool(self.workers)
+        try:
+            super(PartitionedSimulation, self).run()
+        finally:
+            if self.pool is not None:
+                self.pool.close()
+                self.pool.join()
+                self.pool = None
+
+    def fork(self, overrides=None, seed=None):
+        """ Returns a partitioned branch of the simulation, with the same
+        number of workers; see Simulation.fork.
+        """
+        branch = super(PartitionedSimulation, self).fork(overrides, seed)
+        branch.workers = self.workers
+        branch.regions = copy.copy(self.regions)
+        branch.partitioned = self.partitioned
+        return branch
+
+    def partition(self):
+        self.regions = partition_regions(self.world.network,
+                                         self.config.get('regions', 8),
+                                         seed=self.config['seed'] + self.world.turn)
+        self.partitioned = self.world.turn
+
+    def concurrent_turn(self, concurrency):
+        world = self.world
+        if self.regions is None or \
+                world.turn - self.partitioned >= self.config.get('repartition', 100):
+            self.partition()
+
+        involved = set()
+        local = {}
+
+        for state in world.random_states(concurrency):
+            target = state.scan_targets()
+            if target is None:
+                continue
+
+            participants = world.participants(state, target)
+            if participants & involved:
+                continue
+            involved |= participants
+
+            local.setdefault(self.regions[state.name], []).append(
+                (state, target, participants))
+
+        if not involved:
+            return
+
+        seed = np.random.randint(2 ** 31)
+        tasks = [self.region_task(seed, region, encounters)
+                 for region, encounters in sorted(local.items())]
+        if self.pool is not None:
+            results = self.pool.map(region_turn, tasks)
+        else:
+            results = [region_turn(i) for i in tasks]
+
+        for power, conquered, wars in results:
+            for k, p in power.items():
+                world.world[k].power = p
+            for k, victor in conquered.items():
+                world.world[k].conquered = world.world[victor]
+                world.below_threshold[k] = world.world[k]
+            world.wars.extend(wars)
+
+        logger.info('Turn %s: %s encounters in %s regions'
+                    % (world.turn, sum(len(i) for i in local.values()), len(local)))
+        self.end_turn()
+
+    def region_task(self, seed, region, encounters):
+        """ Packs a region's encounters, and the states taking part in them,
+        for region_turn.
+        """
+        initiating = set()
+        names = set()
+        for state, target, participants in encounters:
+            initiating.update([state.name, target.name])
+            names |= participants
+
+        states = []
+        for k in sorted(names):
+            i = self.world.world[k]
+            border = [j.name for j in i.border] if k in initiating else None
+            states.append((k, i.power, i.power0, i.misperception, border))
+
+        pairs = [(state.name, target.name) for state, target, _ in encounters]
+        return (self.config, self.world.turn, seed, region, states, pairs)
+
+    def end_turn(self):
+        """ InternationalSystem.end_turn for large worlds: growth and
+        perception errors are drawn for every state in one go, alliances are
+        only reset where they were formed, and borders only redrawn around
+        conquests.
+
+        As in InternationalSystem.end_turn, the world is processed in order,
+        so a neighbor of a dead state passes on its border to the conqueror
+        if it has more than 1 power, after growth if it comes before the dead
+        state.
+        """
+        world = self.world
+        config = self.config
+
+        states = list(world.world.values())
+        order = {k: i for i, k in enumerate(world.world)}
+        power = np.array([i.power for i in states])
+        growth = cauchy.rvs(size=len(states), loc=config['growth_mu'],
+                            scale=config['growth_sigma'])
+        growth = np.clip(growth, -0.30, 0.15)
+        error = np.random.normal(loc=1, scale=config['misperception_sigma'],
+                                 size=len(states))
+        grown = np.maximum(power * (1 + growth), 1)
+
+        # Graph.copy() would reorder neighbors, and with them borders
+        if world.below_threshold and world.network_shared:
+            world.network = copy.deepcopy(world.network)
+            world.network_shared = False
+
+        alive = np.ones(len(states), dtype=bool)
+        redraw = set()
+        dead = [k for k in world.below_threshold if world.world[k].power < 1]
+        for k in sorted(dead, key=order.get):
+            logger.info('State %s is removed from system' % k)
+            world.state.append({'state_id': k,
+                                'survived_to': world.turn})
+
+            i = order[k]
+            conqueror = world.world[k].conquered.name
+            neighbors = list(world.network.neighbors(k))
+            for j in neighbors:
+                p = grown[order[j]] if order[j] < i else power[order[j]]
+                if p > 1:
+                    world.network.add_edge(conqueror, j)
+            world.network.remove_node(k)
+            world.world[k].alliance.detach()
+            del world.world[k]
+            alive[i] = False
+            redraw.update(neighbors)
+            redraw.add(conqueror)
+        world.below_threshold = {}
+
+        for state, p, p0, a in zip(states, grown.tolist(), (grown * error).tolist(), alive):
+            if not a:
+                continue
+            if len(state.alliance) > 1:
+                state.alliance = [state]
+            state.power = p
+            state.power0 = p0
+
+        world.draw_borders(world.network, [k for k in redraw if k in world.world])
+        world.record_power(grown[alive])
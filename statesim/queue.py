@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT UNIQUE NOT NULL,
+    config TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    heartbeat REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status);
+"""
+
+
+class WorkQueue(object):
+    """ Work queue of simulation configs, backed by a SQLite file so that
+    several machines sharing a filesystem can split a sweep between them.
+
+    Configs are enqueued once; enqueuing the same config again is a no-op.
+    Workers claim batches of pending configs, heartbeat while they run them,
+    and report each one as done or failed. Configs claimed by a worker that
+    has not heartbeated within lease_timeout seconds are put back in the
+    queue the next time anyone claims work, unless they have already been
+    claimed max_attempts times: a config that kills every worker running it
+    is marked as failed instead of being handed on forever.
+
+    Attributes
+    ----------
+    path : str
+        location of the SQLite database
+    lease_timeout : float
+        seconds without a heartbeat before claimed work is requeued
+    max_attempts : int
+        claims after which expired work is failed rather than requeued
+    """
+
+    def __init__(self, path, lease_timeout=300.0, timeout=60.0, max_attempts=3):
+        """
+        Parameters
+        ----------
+        path : str
+            location of the SQLite database; created if it does not exist
+        lease_timeout : float
+            seconds without a heartbeat before claimed work is requeued
+        timeout : float
+            seconds to wait on a locked database before giving up
+        max_attempts : int
+            claims after which expired work is failed rather than requeued
+        """
+        self.path = path
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.conn = sqlite3.connect(path, timeout=timeout,
+                                    isolation_level=None)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _transaction(self):
+        """ Takes the database write lock up front, so that the reads and
+        writes that follow are atomic with respect to other workers.
+        """
+        self.conn.execute('BEGIN IMMEDIATE')
+
+    def enqueue(self, configs):
+        """ Adds configs to the queue. Returns the number of configs that
+        were not already queued.
+        """
+        rows = [(json.dumps(c, sort_keys=True), json.dumps(c)) for c in configs]
+        self._transaction()
+        try:
+            before = self.conn.total_changes
+            self.conn.executemany('INSERT OR IGNORE INTO tasks (key, config) '
+                                  'VALUES (?, ?)', rows)
+            added = self.conn.total_changes - before
+            self.conn.execute('COMMIT')
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+        logger.info('Enqueued %s new configs' % added)
+        return added
+
+    def requeue_expired(self, now=None):
+        """ Returns work whose lease has run out to the pending pool, or
+        marks it as failed if it has been claimed max_attempts times. Returns
+        the number of tasks requeued.
+        """
+        now = time.time() if now is None else now
+        expired = now - self.lease_timeout
+        cursor = self.conn.execute("UPDATE tasks SET status = 'failed', "
+                                   "result = ? WHERE status = 'claimed' "
+                                   "AND heartbeat < ? AND attempts >= ?",
+                                   (json.dumps({'error': 'lease expired %s times'
+                                                % self.max_attempts}),
+                                    expired, self.max_attempts))
+        if cursor.rowcount > 0:
+            logger.warning('Failed %s tasks whose lease expired %s times'
+                           % (cursor.rowcount, self.max_attempts))
+
+        cursor = self.conn.execute("UPDATE tasks SET status = 'pending', "
+                                   "worker = NULL, heartbeat = NULL "
+                                   "WHERE status = 'claimed' AND heartbeat < ?",
+                                   (expired,))
+        if cursor.rowcount > 0:
+            logger.info('Requeued %s expired tasks' % cursor.rowcount)
+        return cursor.rowcount
+
+    def claim(self, worker_id, n=1):
+        """ Atomically claims up to n pending configs for worker_id. Returns a
+        list of (task_id, config) tuples, which is empty if there is no work
+        left.
+        """
+        now = time.time()
+        self._transaction()
+        try:
+            self.requeue_expired(now)
+            rows = self.conn.execute("SELECT id, config FROM tasks "
+                                     "WHERE status = 'pending' "
+                                     "ORDER BY id LIMIT ?", (n,)).fetchall()
+            self.conn.executemany("UPDATE tasks SET status = 'claimed', "
+                                  "worker = ?, heartbeat = ?, "
+                                  "attempts = attempts + 1 WHERE id = ?",
+                                  [(worker_id, now, i) for i, _ in rows])
+            self.conn.execute('COMMIT')
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+        return [(i, json.loads(config)) for i, config in rows]
+
+    def heartbeat(self, worker_id):
+        """ Renews the lease on all work claimed by worker_id.
+        """
+        self.conn.execute("UPDATE tasks SET heartbeat = ? "
+                          "WHERE status = 'claimed' AND worker = ?",
+                          (time.time(), worker_id))
+
+    def _report(self, task_id, worker_id, status, result):
+        cursor = self.conn.execute("UPDATE tasks SET status = ?, result = ?, "
+                                   "heartbeat = ? WHERE id = ? "
+                                   "AND status = 'claimed' AND worker = ?",
+                                   (status, json.dumps(result), time.time(),
+                                    task_id, worker_id))
+        if cursor.rowcount == 0:
+            logger.warning('Worker %s no longer holds task %s' % (worker_id, task_id))
+            return False
+        return True
+
+    def complete(self, task_id, worker_id, result=None):
+        """ Marks a claimed task as done. Returns False if the worker's lease
+        had already expired and the task was handed to someone else.
+        """
+        return self._report(task_id, worker_id, 'done', result)
+
+    def fail(self, task_id, worker_id, result=None):
+        """ Marks a claimed task as failed, so that it is not retried.
+        """
+        return self._report(task_id, worker_id, 'failed', result)
+
+    def counts(self):
+        """ Returns a dict with the number of tasks in each status.
+        """
+        rows = self.conn.execute('SELECT status, COUNT(*) FROM tasks '
+                                 'GROUP BY status').fetchall()
+        counts = {'pending': 0, 'claimed': 0, 'done': 0, 'failed': 0}
+        counts.update(dict(rows))
+        return counts
+
+    def results(self, status='done'):
+        """ Returns (config, result) tuples for all tasks with status.
+        """
+        rows = self.conn.execute('SELECT config, result FROM tasks '
+                                 'WHERE status = ? ORDER BY id',
+                                 (status,)).fetchall()
+        return [(json.loads(c), json.loads(r)) for c, r in rows]
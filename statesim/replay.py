@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+
+import numpy as np
+
+from statesim.sim import Simulation
+
+logger = logging.getLogger(__name__)
+
+# Outcome codes in the decision log
+PEACE = 0
+OFFENSE = 1
+DEFENSE = 2
+
+
+def decision_log(wars):
+    """ Compacts the war data set of a world -- a list of dicts -- into
+    int32 arrays of turn, offense, defense and outcome code.
+    """
+    log = {'turn': [], 'offense': [], 'defense': [], 'outcome': []}
+    for war in wars:
+        log['turn'].append(war['turn'])
+        log['offense'].append(war['offense'])
+        log['defense'].append(war['defense'])
+        if not war['war']:
+            log['outcome'].append(PEACE)
+        elif war['outcome'] == war['offense']:
+            log['outcome'].append(OFFENSE)
+        else:
+            log['outcome'].append(DEFENSE)
+    return {k: np.array(v, dtype=np.int32) for k, v in log.items()}
+
+
+class RunRecord(object):
+    """ Compact, event-sourced record of a simulation run: its config, which
+    includes the seed of the random number generator, and a log of every
+    encounter's participants and outcome.
+
+    Since Simulation seeds numpy from the config, replaying the config
+    reconstructs the world exactly; the log is checked against the replay to
+    catch divergence, e.g. after changes to the model.
+
+    Attributes
+    ----------
+    config : dict
+        parameters of the simulation, including its seed
+    log : dict
+        int32 arrays of turn, offense, defense and outcome of each encounter
+    turns : int or None
+        last turn played, if the run was cancelled over budget
+    """
+
+    def __init__(self, config, log, turns=None):
+        self.config = config
+        self.log = log
+        self.turns = turns
+
+    def __len__(self):
+        return len(self.log['turn'])
+
+    @classmethod
+    def from_simulation(cls, sim):
+        turns = sim.world.turn if sim.cancelled is not None else None
+        return cls(dict(sim.config), decision_log(sim.world.wars), turns)
+
+    def save(self, path):
+        turns = -1 if self.turns is None else self.turns
+        np.savez_compressed(path, config=np.array(json.dumps(self.config)),
+                            turns=np.array(turns), **self.log)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            config = json.loads(str(f['config']))
+            log = {k: f[k] for k in ['turn', 'offense', 'defense', 'outcome']}
+            turns = int(f['turns'])
+        return cls(config, log, None if turns < 0 else turns)
+
+    def check(self, wars, start):
+        """ Raises ValueError if the encounters in wars from index start on
+        differ from the log.
+        """
+        replayed = decision_log(wars[start:])
+        end = start + len(replayed['turn'])
+        for k, v in replayed.items():
+            if not np.array_equal(v, self.log[k][start:end]):
+                raise ValueError('Replay diverged from run record at turn %s'
+                                 % wars[start]['turn'])
+        return end
+
+    def play(self, templates=None):
+        """ Generator that replays the run, yielding the Simulation once the
+        world is built (turn 0) and after each turn, once the turn's
+        encounters have been checked against the log.
+        """
+        sim = Simulation(config=self.config, templates=templates)
+        checked = 0
+        for turn in sim.steps():
+            checked = self.check(sim.world.wars, checked)
+            yield sim
+            if self.turns is not None and turn >= self.turns:
+                break
+
+    def replay(self, turn=None, templates=None):
+        """ Reconstructs the InternationalSystem as it was at the end of turn;
+        by default, at the end of the run.
+        """
+        world = None
+        for sim in self.play(templates=templates):
+            world = sim.world
+            if turn is not None and world.turn >= turn:
+                break
+        return world
+
+    def trajectories(self, templates=None):
+        """ Generator of the per-state power trajectories of the run, yielding
+        for each turn, starting at 0, the turn and a dict of the power of each
+        state alive at its end.
+        """
+        for sim in self.play(templates=templates):
+            yield sim.world.turn, {k: v.power for k, v in sim.world.world.items()}
@@ -1,10 +1,14 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import copy
 import logging
+import multiprocessing
 
+import numpy as np
 import pandas as pd
 
+from statesim.budget import BudgetExceeded
 from statesim.system import InternationalSystem
 from statesim.state import State
 
@@ -14,105 +18,256 @@ class Simulation(object):
     """ Main object controlling the simulation.
     """
 
-    def __init__(self, config):
+    def __init__(self, config, templates=None, budget=None):
         """
         Parameters
         ----------
         config : dict
             houses parameters governing the simulation
+        templates : WorldTemplates, optional
+            cache of world maps shared between simulations
+        budget : Budget, optional
+            time, turn and memory limits on the run
         """
         self.config = config
+        self.templates = templates
+        self.budget = budget
+        self.cancelled = None
         self.state = None
         self.system = None
         self.war = None
         self.world = None
+        self.rng_state = None
+        self.forked = None
 
     def run(self):
+        """ Runs the simulation for niter turns, or until a universal empire
+        emerges.
 
-        world = InternationalSystem(config=self.config)
+        If the config sets concurrency above 1, that many states are picked
+        to initiate each turn. Encounters whose participants do not overlap
+        are resolved in the same turn, and their war damage is assessed in
+        one batch before the turn ends (Duffy 1992).
 
-        self.world = world
-        
-        # WRITE SYSTEM: self.generate_world(): initial power distribution
+        If the simulation has a Budget, it is checked after every turn. A run
+        over budget is cancelled, with the reason in self.cancelled, and keeps
+        its results up to the turn it was cancelled.
+        """
+        if self.budget is not None:
+            self.budget.start()
+
+        try:
+            for turn in self.steps():
+                if self.budget is not None:
+                    self.budget.check(turn)
+        except BudgetExceeded as e:
+            logger.warning('Simulation cancelled, over budget on %s' % e.reason)
+            self.cancelled = e.reason
+
+        # Write data back to Simulation object
+        self.wars = pd.DataFrame(self.world.wars)
+        self.system = pd.DataFrame(self.world.system)
+        self.state = pd.DataFrame(self.world.state)
+
+    def steps(self):
+        """ Generator that builds the world and plays it one turn at a time,
+        yielding 0 once the world is built, then the number of each turn once
+        it is over. A simulation that already has a world, e.g. a fork, is
+        continued from its current turn.
 
-        for i in range(1, self.config['niter']):
+        numpy's random number generator is seeded from the config, so that a
+        simulation is fully determined by its config. Its state is saved at
+        every yield and restored before the next turn, so simulations played
+        in turn in one process do not disturb each other's draws.
+        """
+        if self.world is None:
+            np.random.seed(self.config['seed'])
+            self.world = InternationalSystem(config=self.config,
+                                             templates=self.templates)
 
+            # WRITE SYSTEM: self.generate_world(): initial power distribution
+            self.rng_state = np.random.get_state()
+            yield 0
+
+        world = self.world
+        concurrency = self.config.get('concurrency', 1)
+
+        for i in range(world.turn + 1, self.config['niter']):
+
+            np.random.set_state(self.rng_state)
             world.turn = i
 
             if len(world.world) == 1:
                 print('Universal empire')
                 break
-        
-            # Randomly select state
-            state = world.random_state()
 
-            # State looks for a target state to pick on; if none are weaker, go to 
-            # next turn
+            if concurrency > 1:
+                self.concurrent_turn(concurrency)
+            else:
+                self.serial_turn()
+
+            self.rng_state = np.random.get_state()
+            yield i
+
+    def serial_turn(self):
+        """ Picks one initiating state and resolves its encounter.
+        """
+        world = self.world
+
+        # Randomly select state
+        state = world.random_state()
+
+        # State looks for a target state to pick on; if none are weaker, go to
+        # next turn
+        target = state.scan_targets()
+        if target is None:
+            return
+
+        war = self.encounter(state, target)
+        if war is not None:
+            world.assess_war_damage(war)
+        world.end_turn()
+
+    def fork(self, overrides=None, seed=None):
+        """ Returns a branch of the simulation from its current turn, to be
+        continued independently with run(), e.g. to toggle versailles or
+        change reparations mid-history.
+
+        Records of past turns are shared with the branch, and the map is only
+        copied once either side changes it. The branch continues the random
+        stream where this simulation left it unless a new seed is given.
+
+        Parameters
+        ----------
+        overrides : dict, optional
+            config parameters to change in the branch
+        seed : int, optional
+            seed for the branch's random numbers from here on
+        """
+        if self.world is None:
+            raise ValueError('Simulation must be started before it is forked')
+
+        config = dict(self.config, **(overrides or {}))
+        branch = self.__class__(config=config, templates=self.templates,
+                                budget=copy.copy(self.budget))
+        branch.world = self.world.fork(config=config, seed=seed)
+        if seed is None:
+            branch.rng_state = self.rng_state
+        else:
+            branch.rng_state = np.random.RandomState(seed).get_state()
+        branch.forked = {'turn': self.world.turn,
+                         'overrides': overrides or {},
+                         'seed': seed}
+        return branch
+
+    def concurrent_turn(self, concurrency):
+        """ Picks up to concurrency initiating states and resolves the
+        encounters of those whose participants -- the two states and every
+        state bordering either, i.e. all potential allies -- do not overlap
+        with an encounter already accepted this turn.
+        """
+        world = self.world
+        involved = set()
+        wars = []
+        active = False
+
+        for state in world.random_states(concurrency):
             target = state.scan_targets()
             if target is None:
                 continue
 
-            state_est_target = state.estimate_power(target)
-            if state_est_target > state.power0:
-                world.record_peace(state, target)
-                world.end_turn()
+            participants = world.participants(state, target)
+            if participants & involved:
                 continue
+            involved |= participants
+            active = True
 
-            # Targetted state looks for allies
-            # Target estimates the power of the iniating state
-            target_est_state = target.estimate_power(state)
-            if target.power0 <= target_est_state:
-                target_potential_alliance = target.seek_allies(against=state)
-                for ally in target_potential_alliance:
-                    if ally != target:
-                        target.propose_alliance(to=ally,
-                                                alliance=target_potential_alliance,
-                                                against=state)
-
-            # Re-estimate target's power; if remains less, war
-            # Otherwise, search for an offensive alliance
-            state_est_target = state.estimate_alliance(target)
-            if state_est_target < state.power0:
-                war = world.war(state, target)
-                world.assess_war_damage(war)
-                world.end_turn()
-                continue
-            else:
-                state_potential_alliance = state.seek_allies(against=target)
-                for ally in state_potential_alliance:
-                    if ally != state:
-                        state.propose_alliance(to=ally,
-                                               alliance=state_potential_alliance,
-                                               against=target)
-                # if there are any rejections, state backs down
-                if len(state.alliance) < len(state_potential_alliance):
-                    world.record_peace(state, target)
-                    world.end_turn()
-                    continue
-
-            # Target re-estimates its alliance, and state's alliance; if weaker,
-            # seek more allies
-            target_est_alliance = target.estimate_alliance(target)
-            target_est_state_alliance = target.estimate_alliance(state)
-            if target_est_alliance < target_est_state_alliance:
-                target_potential_alliance = target.seek_allies(against=state)
-                propose_to = [i for i in target_potential_alliance if i not in target.alliance]
-                for ally in propose_to:
-                    target.propose_alliance(to=ally, alliance=target_potential_alliance,
+            war = self.encounter(state, target)
+            if war is not None:
+                wars.append(war)
+
+        if wars:
+            world.assess_war_damage_batch(wars)
+        if active:
+            world.end_turn()
+
+    def encounter(self, state, target):
+        """ Diplomacy between an initiating state and its target, ending
+        either in peace or in war. Returns the war, with damage not yet
+        assessed, or None if the states made peace.
+        """
+        world = self.world
+
+        state_est_target = state.estimate_power(target)
+        if state_est_target > state.power0:
+            world.record_peace(state, target)
+            return None
+
+        # Targetted state looks for allies
+        # Target estimates the power of the iniating state
+        target_est_state = target.estimate_power(state)
+        if target.power0 <= target_est_state:
+            target_potential_alliance = target.seek_allies(against=state)
+            for ally in target_potential_alliance:
+                if ally != target:
+                    target.propose_alliance(to=ally,
+                                            alliance=target_potential_alliance,
                                             against=state)
 
-            # State compares balance of power one last time
-            state_est_alliance = state.estimate_alliance(state)
-            state_est_target_alliance = state.estimate_alliance(target)
-            if state_est_alliance > state_est_target_alliance:
-                war = world.war(state, target)
-                world.assess_war_damage(war)
-            else:
+        # Re-estimate target's power; if remains less, war
+        # Otherwise, search for an offensive alliance
+        state_est_target = state.estimate_alliance(target)
+        if state_est_target < state.power0:
+            return world.war(state, target)
+        else:
+            state_potential_alliance = state.seek_allies(against=target)
+            for ally in state_potential_alliance:
+                if ally != state:
+                    state.propose_alliance(to=ally,
+                                           alliance=state_potential_alliance,
+                                           against=target)
+            # if there are any rejections, state backs down
+            if len(state.alliance) < len(state_potential_alliance):
                 world.record_peace(state, target)
+                return None
 
-            world.end_turn()
+        # Target re-estimates its alliance, and state's alliance; if weaker,
+        # seek more allies
+        target_est_alliance = target.estimate_alliance(target)
+        target_est_state_alliance = target.estimate_alliance(state)
+        if target_est_alliance < target_est_state_alliance:
+            target_potential_alliance = target.seek_allies(against=state)
+            propose_to = [i for i in target_potential_alliance if i not in target.alliance]
+            for ally in propose_to:
+                target.propose_alliance(to=ally, alliance=target_potential_alliance,
+                                        against=state)
 
-        # Write data back to Simulation object
-        self.wars = pd.DataFrame(world.wars)
-        self.system = pd.DataFrame(world.system)
-        self.state = pd.DataFrame(world.state)
\ No newline at end of file
+        # State compares balance of power one last time
+        state_est_alliance = state.estimate_alliance(state)
+        state_est_target_alliance = state.estimate_alliance(target)
+        if state_est_alliance > state_est_target_alliance:
+            return world.war(state, target)
+        else:
+            world.record_peace(state, target)
+            return None
+
+
+def _run_branch(branch):
+    branch.run()
+    return branch
+
+
+def run_branches(sim, branches, workers=1):
+    """ Forks sim into one branch per (overrides, seed) pair in branches and
+    runs each to the end, in a pool of worker processes if workers is above
+    1. Returns the finished branches, in order.
+    """
+    forks = [sim.fork(overrides, seed) for overrides, seed in branches]
+    if workers > 1:
+        # Do not send the map cache to worker processes
+        for i in forks:
+            i.templates = None
+            i.world.templates = None
+        with multiprocessing.Pool(workers) as pool:
+            return pool.map(_run_branch, forks)
+    return [_run_branch(i) for i in forks]
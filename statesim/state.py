@@ -6,20 +6,168 @@ import numpy as np
 
 logger = logging.getLogger(__name__)
 
+class Alliance(list):
+    """ List of allied states that keeps the total power of its members up
+    to date, as states join or leave and as their power changes, so that it
+    can be read without summing over the members. Every method of list that
+    adds or removes members does so.
+
+    Attributes
+    ----------
+    power : float
+        total power of the members
+    """
+
+    def __init__(self, states=()):
+        super(Alliance, self).__init__()
+        self.power = 0.0
+        self.extend(states)
+
+    def _track(self, state):
+        state._alliances.append(self)
+        self.power += state.power
+
+    def _untrack(self, state):
+        # A state in the alliance twice is tracked twice; drop one of them
+        for i, a in enumerate(state._alliances):
+            if a is self:
+                del state._alliances[i]
+                break
+        self.power -= state.power
+
+    def append(self, state):
+        super(Alliance, self).append(state)
+        self._track(state)
+
+    def extend(self, states):
+        for i in states:
+            self.append(i)
+
+    def insert(self, index, state):
+        super(Alliance, self).insert(index, state)
+        self._track(state)
+
+    def remove(self, state):
+        del self[self.index(state)]
+
+    def pop(self, index=-1):
+        state = super(Alliance, self).pop(index)
+        self._untrack(state)
+        return state
+
+    def clear(self):
+        del self[:]
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = list(value)
+            old, new = self[index], value
+        else:
+            old, new = [self[index]], [value]
+        super(Alliance, self).__setitem__(index, value)
+        for i in old:
+            self._untrack(i)
+        for i in new:
+            self._track(i)
+
+    def __delitem__(self, index):
+        old = self[index] if isinstance(index, slice) else [self[index]]
+        super(Alliance, self).__delitem__(index)
+        for i in old:
+            self._untrack(i)
+
+    def __iadd__(self, states):
+        self.extend(states)
+        return self
+
+    def __imul__(self, n):
+        if n <= 0:
+            self.clear()
+        else:
+            self.extend(list(self) * (n - 1))
+        return self
+
+    def detach(self):
+        """ Stops tracking the power of the members, once the alliance has
+        been replaced.
+        """
+        for i in self:
+            i._alliances = [a for a in i._alliances if a is not self]
+
+    def __reduce__(self):
+        # Members are restored with their own references to the alliance, so
+        # unpickling must not append to them again
+        return (_restore_alliance, (list(self), self.power))
+
+
+def _restore_alliance(states, power):
+    alliance = Alliance()
+    list.extend(alliance, states)
+    alliance.power = power
+    return alliance
+
+
 class State(object):
     """ Represents a state, including its power, borders, and alliances.
     """
 
-    def __init__(self, name, power, misperception=0.2):
+    def __init__(self, name, power, misperception=0.2, rng=None):
         self.name = name
         self.misperception = misperception
-        self.power = power
-        self.power0 = self.power * np.random.normal(loc=1,
-                                                    scale=self.misperception)
+        # Stream for perception errors; numpy's global one if None
+        self.rng = rng
+        # Alliances this state is counted in
+        self._alliances = []
+        self._power = power
+        self.power0 = self.power * self.random().normal(loc=1,
+                                                        scale=self.misperception)
         self.border = []
         self.alliance = [self]
         self.conquered = None
 
+    def copy(self, rng=None):
+        """ Returns a copy of the state between turns, without borders, for
+        a forked world. Its alliance is reset to itself alone.
+        """
+        state = State.__new__(State)
+        state.name = self.name
+        state.misperception = self.misperception
+        state.rng = rng
+        state._alliances = []
+        state._power = self._power
+        state.power0 = self.power0
+        state.border = []
+        state.alliance = [state]
+        state.conquered = None
+        return state
+
+    @property
+    def power(self):
+        return self._power
+
+    @power.setter
+    def power(self, power):
+        """ Keeps the totals of the alliances the state is in up to date.
+        """
+        change = power - self._power
+        for a in self._alliances:
+            a.power += change
+        self._power = power
+
+    @property
+    def alliance(self):
+        return self._alliance
+
+    @alliance.setter
+    def alliance(self, states):
+        """ Replaces the state's alliance, e.g. when alliances are wiped out
+        at the end of a turn.
+        """
+        old = getattr(self, '_alliance', None)
+        if old is not None:
+            old.detach()
+        self._alliance = Alliance(states)
+
     def scan_targets(self):
         """
         """
@@ -34,7 +182,9 @@ class State(object):
         """
         against_power_est = self.estimate_alliance(against)
 
+        alliance_power = self.alliance.power
         all_alliances = []
+        alliances_power = []
         potential_allies = [i for i in against.border if i not in self.alliance and i not in against.alliance]
         for i in range(len(potential_allies) + 1):
             counter = 0
@@ -42,6 +192,7 @@ class State(object):
                 if counter < 100:
                     c_list = [j for j in c]
                     all_alliances.append(self.alliance + c_list)
+                    alliances_power.append(alliance_power + sum(j.power for j in c_list))
                     counter += 1
                 else:
                     break
@@ -50,9 +201,9 @@ class State(object):
 
         # n = min(len(all_alliances), 1000)
         # alliances_power = np.array([sum(i) for i in all_alliances[0:n]])
-        alliances_power = np.array([sum(i) for i in all_alliances])
+        alliances_power = np.array(alliances_power)
 
-        winning_alliances = np.where(alliances_power <= sum(against.alliance), np.inf, alliances_power)
+        winning_alliances = np.where(alliances_power <= against.alliance.power, np.inf, alliances_power)
 
         ix = np.argmin(winning_alliances)
         mwc = all_alliances[ix]
@@ -114,7 +265,7 @@ class State(object):
         config settings to calculate error.
         """
         # if type(state) == State:
-        estimate = state.power * np.random.normal(loc=1, scale=self.misperception)
+        estimate = state.power * self.random().normal(loc=1, scale=self.misperception)
         logger.info('%s estimates %s power as %s' % (self, state, round(estimate, 2)))
         return estimate
         # elif type(state) == list:
@@ -138,6 +289,11 @@ class State(object):
         return sum(allies_power)
 
 
+    def random(self):
+        """ Returns the random stream used for perception errors.
+        """
+        return np.random if self.rng is None else self.rng
+
     def __repr__(self):
         return 'State %s (power=%s)' % (self.name, round(self.power, 2))
 
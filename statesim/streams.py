@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+
+class RandomStreams(object):
+    """ Separate random streams for each source of randomness in a
+    simulation, used in common-random-numbers (CRN) mode, set by crn in the
+    config.
+
+    Two configs run with the same seed in CRN mode draw their initial power,
+    perception errors, initiating states and war outcomes from the same
+    streams, so that they are compared under the same luck rather than with
+    full Monte Carlo noise. Growth and the self-perception of power at the end
+    of each turn are drawn per turn and per state, so they stay aligned even
+    after the two histories diverge.
+
+    Attributes
+    ----------
+    seed : int
+        seed all streams are derived from
+    power, perception, initiative, war : np.random.RandomState
+        streams for initial power, estimates of power, picking the initiating
+        state, and war outcomes and costs
+    """
+
+    SOURCES = ['power', 'perception', 'initiative', 'war']
+
+    def __init__(self, seed):
+        self.seed = seed
+        children = np.random.SeedSequence(seed).spawn(len(self.SOURCES))
+        for source, child in zip(self.SOURCES, children):
+            setattr(self, source, np.random.RandomState(np.random.MT19937(child)))
+
+    def shocks(self, turn, n):
+        """ Returns standard Cauchy growth shocks and standard normal
+        perception shocks for states 0 to n - 1 at the end of turn. They
+        depend only on the seed, turn and state, not on the history so far.
+        """
+        seq = np.random.SeedSequence(self.seed, spawn_key=(len(self.SOURCES), turn))
+        rng = np.random.RandomState(np.random.MT19937(seq))
+        return rng.standard_cauchy(n), rng.standard_normal(n)
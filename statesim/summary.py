@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Config entries that differ between replicates of the same config
+RUN_KEYS = ['seed', 'map_seed', 'sim_id']
+
+
+def config_key(config):
+    """ Identifies a config independently of the seed of any one run.
+    """
+    return json.dumps({k: v for k, v in config.items() if k not in RUN_KEYS},
+                      sort_keys=True)
+
+
+class SweepSummary(object):
+    """ Running per-config summaries of finished simulations, for survival
+    analysis while a sweep is still going.
+
+    Each simulation is folded in with add(), without touching its CSVs.
+    Per config, the summary counts runs, runs cancelled over budget, states,
+    state deaths and states censored (still alive at the end of the run),
+    total state-turns at risk, a histogram of state lifetimes, system
+    durations and universal empires, and wars and peaceful encounters.
+
+    Attributes
+    ----------
+    path : str or None
+        JSON file the summaries are checkpointed to
+    checkpoint_every : int
+        number of simulations between checkpoints
+    bin_width : int
+        width, in turns, of the lifetime histogram bins
+    """
+
+    def __init__(self, path=None, checkpoint_every=100, bin_width=10):
+        self.path = path
+        self.checkpoint_every = checkpoint_every
+        self.bin_width = bin_width
+        self.summaries = {}
+        self.added = 0
+
+    def new_summary(self, config):
+        nbins = config['niter'] // self.bin_width + 1
+        return {'config': {k: v for k, v in config.items() if k not in RUN_KEYS},
+                'runs': 0,
+                'cancelled': 0,
+                'states': 0,
+                'deaths': 0,
+                'censored': 0,
+                'exposure': 0,
+                'lifetimes': [0] * nbins,
+                'duration': 0,
+                'universal_empires': 0,
+                'wars': 0,
+                'wars_sq': 0,
+                'peace': 0}
+
+    def add(self, sim):
+        """ Folds a finished Simulation into the summary of its config.
+        """
+        config = sim.config
+        world = sim.world
+        key = config_key(config)
+        if key not in self.summaries:
+            self.summaries[key] = self.new_summary(config)
+        s = self.summaries[key]
+
+        survived_to = np.array([i['survived_to'] for i in world.state], dtype=int)
+        survivors = len(world.world)
+        wars = sum(1 for i in world.wars if i['war'])
+
+        s['runs'] += 1
+        s['cancelled'] += int(sim.cancelled is not None)
+        s['states'] += len(survived_to) + survivors
+        s['deaths'] += len(survived_to)
+        s['censored'] += survivors
+        s['exposure'] += int(survived_to.sum()) + survivors * world.turn
+        hist = np.bincount(survived_to // self.bin_width,
+                           minlength=len(s['lifetimes']))
+        s['lifetimes'] = (np.array(s['lifetimes']) + hist).tolist()
+        s['duration'] += world.turn
+        s['universal_empires'] += int(survivors == 1)
+        s['wars'] += wars
+        s['wars_sq'] += wars ** 2
+        s['peace'] += len(world.wars) - wars
+
+        self.added += 1
+        if self.path is not None and self.added % self.checkpoint_every == 0:
+            self.checkpoint()
+
+    def merge(self, other):
+        """ Adds the summaries of another SweepSummary, e.g. from another
+        worker, into this one.
+        """
+        for key, o in other.summaries.items():
+            if key not in self.summaries:
+                self.summaries[key] = json.loads(json.dumps(o))
+                continue
+            s = self.summaries[key]
+            for k, v in o.items():
+                if k == 'config':
+                    continue
+                elif k == 'lifetimes':
+                    s[k] = [a + b for a, b in zip(s[k], v)]
+                else:
+                    s[k] += v
+
+    def checkpoint(self, path=None):
+        """ Writes the summaries to path as JSON, atomically, so that a
+        reader never sees a partial file.
+        """
+        path = self.path if path is None else path
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'bin_width': self.bin_width,
+                       'summaries': self.summaries}, f)
+        os.replace(tmp, path)
+        logger.info('Checkpointed summaries of %s configs' % len(self.summaries))
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        with open(path) as f:
+            data = json.load(f)
+        summary = cls(path=path, bin_width=data['bin_width'], **kwargs)
+        summary.summaries = data['summaries']
+        return summary
+
+    def table(self):
+        """ Returns the headline table: one row per config, with its
+        parameters, number of runs, share of runs cancelled, state death rate
+        per turn at risk, share of states censored, mean system duration,
+        share of runs ending in a universal empire, and mean and standard
+        deviation of war counts.
+        """
+        rows = []
+        for s in self.summaries.values():
+            runs = s['runs']
+            wars_mean = s['wars'] / runs
+            row = dict(s['config'])
+            row.update({'runs': runs,
+                        'cancelled': s['cancelled'] / runs,
+                        'states': s['states'],
+                        'deaths': s['deaths'],
+                        'death_rate': s['deaths'] / max(s['exposure'], 1),
+                        'censored': s['censored'] / s['states'],
+                        'duration': s['duration'] / runs,
+                        'universal_empire': s['universal_empires'] / runs,
+                        'wars': wars_mean,
+                        'wars_sd': np.sqrt(max(s['wars_sq'] / runs - wars_mean ** 2, 0)),
+                        'peace': s['peace'] / runs})
+            rows.append(row)
+        return pd.DataFrame(rows)
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from itertools import product
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from statesim.queue import WorkQueue
+from statesim.replay import RunRecord
+from statesim.sim import Simulation
+from statesim.summary import SweepSummary
+from statesim.templates import WorldTemplates
+
+logger = logging.getLogger(__name__)
+
+
+def expand_sweep(base, spec):
+    """ Expands a sweep specification into a list of configs, in a fixed
+    order. spec is a dict with a grid, mapping parameters to lists of values,
+    and optionally a number of replicates; every combination of the grid is
+    applied to the base config, replicates times.
+
+    Each config gets its own seed, drawn in order from a generator seeded
+    with the base config's seed, so the same base and spec always expand to
+    the same configs. If spec sets a number of maps, configs are dealt a
+    map_seed in turn from that many, so that they share maps, which a
+    WorldTemplates cache then generates once each; otherwise every config
+    gets its own map.
+    """
+    grid = spec.get('grid', {})
+    replicates = spec.get('replicates', 1)
+    rng = random.Random(base['seed'])
+
+    configs = []
+    for values in product(*grid.values()):
+        for _ in range(replicates):
+            config = dict(base)
+            config.update(zip(grid.keys(), values))
+            config['seed'] = rng.randint(1, int(10e6))
+            configs.append(config)
+
+    if spec.get('maps'):
+        rng = random.Random(base.get('map_seed', base['seed']))
+        map_seeds = [rng.randint(1, int(10e6)) for _ in range(spec['maps'])]
+        for i, config in enumerate(configs):
+            config['map_seed'] = map_seeds[i % len(map_seeds)]
+    return configs
+
+
+def shard(configs, index, count):
+    """ Returns the (number, config) pairs of shard index out of count.
+    Configs are dealt out round robin, so shards are balanced across the grid.
+    """
+    if not 0 <= index < count:
+        raise ValueError('Shard index %s out of range for %s shards' % (index, count))
+    return [(i, c) for i, c in enumerate(configs) if i % count == index]
+
+
+def save_results(sim, config, sim_id, output_dir='./data'):
+    """ Writes a finished simulation's config and its state, system and wars
+    data sets to output_dir. The config of a run cancelled over budget also
+    records the reason, and the last turn played as turns, as in RunRecord.
+    """
+    config = dict(config, sim_id=sim_id)
+    if sim.cancelled is not None:
+        config['cancelled'] = sim.cancelled
+        config['turns'] = sim.world.turn
+    with open(os.path.join(output_dir, 'config', 'config_%s.json' % sim_id), 'w+') as f:
+        f.write(json.dumps(config))
+
+    for name in ['state', 'system', 'wars']:
+        df = getattr(sim, name)
+        df['sim_id'] = sim_id
+        df.to_csv(os.path.join(output_dir, name, '%s_%s.csv' % (name, sim_id)),
+                  index=False)
+
+
+def save_record(sim, sim_id, output_dir='./data'):
+    """ Writes a compact RunRecord of a finished simulation, from which its
+    full outputs can be replayed, to output_dir/record.
+    """
+    RunRecord.from_simulation(sim).save(
+        os.path.join(output_dir, 'record', 'record_%s.npz' % sim_id))
+
+
+def save_error(config, sim_id, output_dir='./data'):
+    """ Writes the config of a simulation that raised to output_dir/error.
+    """
+    config = dict(config, sim_id=sim_id)
+    with open(os.path.join(output_dir, 'error', 'config_%s.json' % sim_id), 'w+') as f:
+        f.write(json.dumps(config))
+
+
+def make_dirs(output_dir='./data'):
+    for name in ['config', 'state', 'system', 'wars', 'error', 'record']:
+        os.makedirs(os.path.join(output_dir, name), exist_ok=True)
+
+
+def run_config(config, sim_id, output_dir='./data', templates=None,
+               records_only=False, budget=None):
+    """ Runs a single simulation and saves its results, or only its run
+    record if records_only. A simulation cancelled for going over budget
+    saves its partial results, with the reason in its config. If the
+    simulation raises, its config is saved as an error instead. Returns the
+    Simulation, or None if it failed.
+    """
+    try:
+        sim = Simulation(config=config, templates=templates, budget=budget)
+        sim.run()
+        if records_only:
+            save_record(sim, sim_id, output_dir)
+        else:
+            save_results(sim, config, sim_id, output_dir)
+        return sim
+    except Exception:
+        logger.exception('Simulation %s failed' % sim_id)
+        save_error(config, sim_id, output_dir)
+        return None
+
+
+# Per-process state of run_configs' worker pool
+_worker = {}
+
+
+def _init_worker(template_dir, max_files, kwargs):
+    _worker['templates'] = WorldTemplates(directory=template_dir,
+                                          max_files=max_files)
+    _worker['kwargs'] = kwargs
+
+
+def _run_config(args):
+    config, sim_id = args
+    sim = run_config(config, sim_id, templates=_worker['templates'],
+                     **_worker['kwargs'])
+    if sim is not None:
+        # Do not send the worker's map cache back to the parent
+        sim.templates = None
+    return sim
+
+
+def run_configs(configs, output_dir='./data', workers=1, templates=None,
+                summary=None, records_only=False, budget=None):
+    """ Runs a list of (sim_id, config) pairs, in a pool of worker
+    processes if workers is above 1, saving their results to output_dir and
+    folding them into summary, a SweepSummary, if given. Returns the number of
+    simulations that did not fail.
+    """
+    make_dirs(output_dir)
+    template_dir = templates.directory if templates is not None else None
+    max_files = templates.max_files if templates is not None else None
+    kwargs = {'output_dir': output_dir, 'records_only': records_only,
+              'budget': budget}
+    args = [(config, sim_id) for sim_id, config in configs]
+
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, initializer=_init_worker,
+                                    initargs=(template_dir, max_files, kwargs))
+        sims = pool.imap_unordered(_run_config, args)
+    else:
+        pool = None
+        _init_worker(template_dir, max_files, kwargs)
+        if templates is not None:
+            _worker['templates'] = templates
+        sims = map(_run_config, args)
+
+    n = 0
+    try:
+        for sim in sims:
+            if sim is None:
+                continue
+            n += 1
+            if summary is not None:
+                summary.add(sim)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if summary is not None and summary.path is not None:
+            summary.checkpoint()
+
+    logger.info('Ran %s of %s simulations' % (n, len(configs)))
+    return n
+
+
+class Heartbeat(threading.Thread):
+    """ Background thread that renews a worker's lease on its claimed work
+    every interval seconds, so long simulations are not requeued.
+    """
+
+    def __init__(self, path, worker_id, interval):
+        super(Heartbeat, self).__init__(daemon=True)
+        self.path = path
+        self.worker_id = worker_id
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        # SQLite connections cannot be shared across threads
+        queue = WorkQueue(self.path)
+        try:
+            while not self.stopped.wait(self.interval):
+                # A locked database must not end the heartbeat, or the
+                # worker's lease runs out while it is still working
+                try:
+                    queue.heartbeat(self.worker_id)
+                except sqlite3.Error:
+                    logger.exception('Worker %s failed to heartbeat' % self.worker_id)
+        finally:
+            queue.close()
+
+    def stop(self):
+        self.stopped.set()
+
+
+def work(queue_path, worker_id, output_dir='./data', batch_size=1,
+         lease_timeout=300.0, poll=10.0, templates=None, summary=None,
+         records_only=False, budget=None, max_attempts=3):
+    """ Worker loop: claims batches of configs from the queue at queue_path,
+    runs them and reports the outcome, until no work is pending or held by
+    other workers. Finished simulations are folded into summary, a
+    SweepSummary, if given. A config whose lease expires max_attempts times,
+    e.g. because it crashes its worker, is failed. Outputs are saved under a
+    sim_id made of the queue's name and the task, not the worker, so a config
+    that is run again after its lease expired overwrites the outputs of the
+    first run rather than duplicating them. Returns the number of simulations
+    run.
+    """
+    queue = WorkQueue(queue_path, lease_timeout=lease_timeout,
+                      max_attempts=max_attempts)
+    heartbeat = Heartbeat(queue_path, worker_id, lease_timeout / 3.0)
+    heartbeat.start()
+    make_dirs(output_dir)
+    prefix = os.path.splitext(os.path.basename(queue_path))[0]
+    n = 0
+
+    try:
+        while True:
+            batch = queue.claim(worker_id, batch_size)
+            if not batch:
+                # Other workers may still die and have their work requeued
+                if queue.counts()['claimed'] == 0:
+                    break
+                time.sleep(poll)
+                continue
+
+            for task_id, config in batch:
+                sim_id = '%s_%06d' % (prefix, task_id)
+                sim = run_config(config, sim_id, output_dir, templates,
+                                 records_only, budget)
+                if sim is None:
+                    queue.fail(task_id, worker_id, {'sim_id': sim_id})
+                else:
+                    if summary is not None:
+                        summary.add(sim)
+                    queue.complete(task_id, worker_id, {'sim_id': sim_id,
+                                                        'cancelled': sim.cancelled})
+                n += 1
+    finally:
+        heartbeat.stop()
+        queue.close()
+        if summary is not None and summary.path is not None:
+            summary.checkpoint()
+
+    logger.info('Worker %s finished after %s simulations' % (worker_id, n))
+    return n
+
+
+def _worker_summary(summary_path, worker_id):
+    if summary_path is None:
+        return None
+    return SweepSummary(path='%s_%s.json' % (os.path.splitext(summary_path)[0],
+                                             worker_id))
+
+
+def _work(args):
+    queue_path, worker_id, template_dir, max_files, summary_path, kwargs = args
+    templates = WorldTemplates(directory=template_dir, max_files=max_files)
+    return work(queue_path, worker_id, templates=templates,
+                summary=_worker_summary(summary_path, worker_id), **kwargs)
+
+
+def work_processes(queue_path, worker_id, workers=1, templates=None,
+                   summary_path=None, **kwargs):
+    """ Runs the worker loop in workers processes, as workers
+    '<worker_id>-<i>', or as worker_id in this process if workers is 1. Each
+    worker folds its simulations into its own SweepSummary, saved next to
+    summary_path with its worker id, if given. Other keyword arguments are
+    passed on to work. Returns the number of simulations run.
+    """
+    if workers <= 1:
+        return work(queue_path, worker_id, templates=templates,
+                    summary=_worker_summary(summary_path, worker_id), **kwargs)
+
+    template_dir = templates.directory if templates is not None else None
+    max_files = templates.max_files if templates is not None else None
+    args = [(queue_path, '%s-%s' % (worker_id, i), template_dir, max_files,
+             summary_path, kwargs) for i in range(workers)]
+    pool = multiprocessing.Pool(workers)
+    try:
+        return sum(pool.map(_work, args))
+    finally:
+        pool.close()
+        pool.join()
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import copy
 import logging
 import random
 
@@ -11,6 +12,8 @@ import scipy.integrate as integrate
 from scipy.stats import cauchy
 
 from statesim.state import State
+from statesim.streams import RandomStreams
+from statesim.templates import build_network, generate_borders
 
 logger = logging.getLogger(__name__)
 
@@ -31,18 +34,30 @@ class InternationalSystem(object):
         Used to randomly assign initial power levels to states
     """
 
-    def __init__(self, config):
+    def __init__(self, config, templates=None):
         """
         Parameters
         ----------
         config : dict
             houses parameters governing the simulation
+        templates : WorldTemplates, optional
+            cache of world maps; if not given, the map is generated
         """
         self.config = config
+        self.templates = templates
+        # Common random numbers: separate streams, aligned across configs
+        self.streams = RandomStreams(config['seed']) if config.get('crn') else None
         self.turn = 0
         self.state = []
         self.system = []
         self.wars = []
+        # States whose power has fallen below 1, by name; only states that
+        # fought a war can get there, so deaths are found without scanning
+        # the world
+        self.below_threshold = {}
+        # Whether the map is shared with a fork, and must be copied first
+        # if it changes
+        self.network_shared = False
         self.network = self.generate_world()
         
         self.draw_borders(self.network)
@@ -50,22 +65,34 @@ class InternationalSystem(object):
     def generate_world(self):
         """ Creates the world. First, uses networkx to generate a 'map' which
         is represented by a network with each node as a state, and each edge as
-        a border.
+        a border. If the system has a WorldTemplates cache, the map is taken
+        from it instead of being regenerated.
 
         The network is converted to a dictionary.
 
         The initial power distribution is calculated and assigned to each state.
         """
 
-        network = nx.random_regular_graph(self.config['network_p'],
-                                          self.config['network_n'],
-                                          seed=self.config['seed'])
+        # Maps are always built from their array of borders, so that a map
+        # is the same whether or not it came from the cache. Configs with the
+        # same map_seed share a map
+        map_seed = self.config.get('map_seed', self.config['seed'])
+        if self.templates is not None:
+            network = self.templates.network(self.config['network_p'],
+                                             self.config['network_n'],
+                                             map_seed)
+        else:
+            borders = generate_borders(self.config['network_p'],
+                                       self.config['network_n'],
+                                       map_seed)
+            network = build_network(self.config['network_n'], borders)
 
         # Initialize all states
         world = {}
         for i in network.nodes:
             state = State(name=i, power=self.random_power(),
-                          misperception=self.config['misperception_sigma'])
+                          misperception=self.config['misperception_sigma'],
+                          rng=None if self.streams is None else self.streams.perception)
             world[i] = state
 
         self.world = world
@@ -90,16 +117,69 @@ class InternationalSystem(object):
         """
         nx.draw_networkx(self.network)
 
-    def draw_borders(self, network):
-        """ """
+    def draw_borders(self, network, names=None):
+        """ Sets the borders of the states named, or of every state if names
+        is None, from the network.
+        """
         # Wipe out existing borders
-        for i in self.world.keys():
+        for i in (self.world.keys() if names is None else names):
             try:
                 neighbors = [j for j in self.network.neighbors(i) if j != i]
                 self.world[i].border = [self.world[j] for j in neighbors]
             except KeyError:
                 raise
 
+    @classmethod
+    def from_states(cls, config, turn, states):
+        """ Builds a system over a given dict of states, without a map, to
+        resolve encounters among them apart from the rest of the world, as
+        in partitioned execution. Borders must be set by the caller.
+        """
+        system = cls.__new__(cls)
+        system.config = config
+        system.templates = None
+        system.streams = None
+        system.turn = turn
+        system.state = []
+        system.system = []
+        system.wars = []
+        system.below_threshold = {}
+        system.network = None
+        system.network_shared = False
+        system.world = states
+        return system
+
+    def fork(self, config=None, seed=None):
+        """ Returns a copy of the system between turns, to be continued
+        independently, with config if given.
+
+        The records of past turns are shared, since they never change, and
+        so is the map, until either system changes it. In CRN mode, the
+        random streams are copied, or reseeded if seed is given.
+        """
+        fork = InternationalSystem.__new__(InternationalSystem)
+        fork.config = self.config if config is None else config
+        fork.templates = self.templates
+        if self.streams is None:
+            fork.streams = None
+        elif seed is None:
+            fork.streams = copy.deepcopy(self.streams)
+        else:
+            fork.streams = RandomStreams(seed)
+        fork.turn = self.turn
+        fork.state = list(self.state)
+        fork.system = list(self.system)
+        fork.wars = list(self.wars)
+        fork.below_threshold = {}
+
+        fork.network = self.network
+        fork.network_shared = self.network_shared = True
+
+        rng = None if fork.streams is None else fork.streams.perception
+        fork.world = {k: v.copy(rng=rng) for k, v in self.world.items()}
+        fork.draw_borders(fork.network)
+        return fork
+
     def likelihood_victory(self, a, b):
         """ Returns the probability state A wins a war against state B.
 
@@ -111,8 +191,8 @@ class InternationalSystem(object):
         have a greater chance of victory against more pwoerful states. The
         power ratio becomes more and more deterministic and sigma decreases.
         """
-        a_power = sum(a.alliance)
-        b_power = sum(b.alliance)
+        a_power = a.alliance.power
+        b_power = b.alliance.power
         sigma = self.config['victory_sigma']
         const = 1 / np.sqrt(np.pi * sigma)
         f = lambda x: np.exp( -1 * np.square(x / sigma) )
@@ -135,8 +215,8 @@ class InternationalSystem(object):
                  'defense': b.name,
                  'offense0': a.power,
                  'defense0': b.power,
-                 'offense1': sum([i.power for i in a.alliance]),
-                 'defense1': sum([i.power for i in b.alliance]),
+                 'offense1': a.alliance.power,
+                 'defense1': b.alliance.power,
                  'outcome': 'NA'}
 
         self.wars.append(peace)
@@ -154,7 +234,10 @@ class InternationalSystem(object):
         Returns
         """
         lv = self.likelihood_victory(a, b)
-        victory = bool( np.random.binomial(1, lv, 1) )
+        if self.streams is None:
+            victory = bool( np.random.binomial(1, lv, 1) )
+        else:
+            victory = self.streams.war.uniform() < lv
 
         war = {'turn': self.turn,
                'war': True,
@@ -162,8 +245,8 @@ class InternationalSystem(object):
                'defense': b.name,
                'offense0': a.power,
                'defense0': b.power,
-               'offense1': sum([i.power for i in a.alliance]),
-               'defense1': sum([i.power for i in b.alliance]),
+               'offense1': a.alliance.power,
+               'defense1': b.alliance.power,
                'outcome': a.name if victory == True else b.name}
         self.wars.append(war)
 
@@ -188,7 +271,7 @@ class InternationalSystem(object):
         max_cost = self.config['max_war_cost']
         lsr = war['lsr']
         war_cost = (1.0 - ((lsr - 0.5) / 0.5)) * max_cost
-        weight = min(self.config['war_cost_disp'], max_cost * np.random.uniform())
+        weight = min(self.config['war_cost_disp'], max_cost * self.random('war').uniform())
 
         victor_states = war['victor'].alliance
         loser_states = war['loser'].alliance
@@ -232,17 +315,100 @@ class InternationalSystem(object):
 
         # Each victor recieves a portion of spoils, proportionate to their
         # contribution to total power of alliance
-        total_victor_power = sum(victor_states)
+        total_victor_power = victor_states.power
         for i in victor_states:
             reparations = total_reparations * (i.power / total_victor_power)
             i.power += reparations
             logger.info('%s has claimed %s power units as spoils of war' % (i, round(reparations, 2)))
 
-        for k in self.world.keys():
-            if self.world[k].power < 1.0:
-                self.world[k].conquered = war['victor']
+        self.index_deaths(victor_states + loser_states, war['victor'])
 
 
+    def assess_war_damage_batch(self, wars):
+        """ Assesses the damage of several wars fought in the same turn, whose
+        participants do not overlap, in one vectorized pass. Each war is
+        treated exactly as in assess_war_damage: Versailles transfers between
+        the leaders, war costs to both sides, then reparations from losers to
+        victors in proportion to their power.
+        """
+        n = len(wars)
+        max_cost = self.config['max_war_cost']
+        lsr = np.array([war['lsr'] for war in wars])
+        war_cost = (1.0 - ((lsr - 0.5) / 0.5)) * max_cost
+        weight = np.minimum(self.config['war_cost_disp'],
+                            max_cost * self.random('war').uniform(size=n))
+
+        #################
+        # Versailles rule
+
+        if self.config['versailles']:
+            lv = np.array([war['likelihood_victory'] for war in wars])
+            offense_won = np.array([war['victor'] is war['offense'] for war in wars])
+            victor_power = np.array([war['victor'].power for war in wars])
+            loser_power = np.array([war['loser'].power for war in wars])
+
+            # Loser surrenders LV% of power if the offense won; otherwise the
+            # (defending) victor surrenders 1-LV% of its power
+            transfer = np.where(offense_won, loser_power * lv,
+                                victor_power * (1 - lv))
+            victor_power = np.where(offense_won, victor_power + transfer,
+                                    victor_power - transfer)
+            loser_power = np.where(offense_won, loser_power - transfer,
+                                   loser_power + transfer)
+            for war, v, l in zip(wars, victor_power, loser_power):
+                war['victor'].power = float(v)
+                war['loser'].power = float(l)
+
+        #################
+
+        states = []
+        ix = []
+        victor = []
+        for k, war in enumerate(wars):
+            for side in ['victor', 'loser']:
+                for i in war[side].alliance:
+                    states.append(i)
+                    ix.append(k)
+                    victor.append(side == 'victor')
+        ix = np.array(ix)
+        victor = np.array(victor)
+        power = np.array([i.power for i in states])
+
+        # War cost; do not let victors fall below 1
+        victor_cost = np.maximum(war_cost - weight, 0.01)[ix]
+        loser_cost = np.minimum(1, war_cost + weight)[ix]
+        power = np.where(victor, np.maximum(power * (1 - victor_cost), 1),
+                         power * (1 - loser_cost))
+
+        # Spoils, divided between victors in proportion to their power
+        reparations = self.config['reparations']
+        total_reparations = np.bincount(ix, weights=np.where(victor, 0, power * reparations),
+                                        minlength=n)
+        power = np.where(victor, power,
+                         power - np.maximum(power * reparations, .01))
+        total_victor_power = np.bincount(ix, weights=np.where(victor, power, 0),
+                                         minlength=n)
+        power = np.where(victor,
+                         power + total_reparations[ix] * power / total_victor_power[ix],
+                         power)
+
+        for i, p in zip(states, power):
+            i.power = float(p)
+        for k, war in enumerate(wars):
+            self.index_deaths(war['victor'].alliance + war['loser'].alliance,
+                              war['victor'])
+
+        logger.info('Assessed war damage for %s wars' % n)
+
+    def index_deaths(self, states, victor):
+        """ Adds the states among those that fought a war whose power has
+        fallen below 1 to the below-threshold index, as conquered by victor.
+        """
+        for i in states:
+            if i.power < 1.0:
+                i.conquered = victor
+                self.below_threshold[i.name] = i
+
     def end_turn(self):
         """ 1. Remove states with no power left; if so, redraw network and borders
         2. Wipe out alliances
@@ -252,9 +418,25 @@ class InternationalSystem(object):
         power or cells of territory. B. End the run if only one state is left 
         or the iteration limit is reached. Otherwise, grant all remaining states
          internal power growth of 3 percent. The simulation moves to segment.
+
+        In CRN mode, growth and perception shocks are drawn per turn for
+        every state of the original map, so each state gets the same shocks
+        in paired runs.
         """
+        if self.streams is not None:
+            growth_shocks, perception_shocks = self.streams.shocks(self.turn,
+                                                                   self.config['network_n'])
+
+        # Graph.copy() would reorder neighbors, and with them borders
+        if self.below_threshold and self.network_shared:
+            self.network = copy.deepcopy(self.network)
+            self.network_shared = False
+
+        # Walk the world in order, i.e. by name, removing the states in the
+        # below-threshold index and growing the others as they come, so a
+        # neighbor of a dead state has grown if it comes before it
         for k in list(self.world.keys()):
-            if self.world[k].power < 1:
+            if k in self.below_threshold and self.world[k].power < 1:
                 logger.info('State %s is removed from system' % k)
 
                 # Record state death
@@ -270,23 +452,41 @@ class InternationalSystem(object):
                 for j in new_borders:
                     self.network.add_edge(self.world[k].conquered.name, j)
                 self.network.remove_node(k)
+                # Its allies no longer count towards its alliance
+                self.world[k].alliance.detach()
                 del self.world[k]
             else:
                 self.world[k].alliance = [self.world[k]]
                 # growth = np.random.normal(loc=self.config['growth_mu'],
                 #                           scale=self.config['growth_sigma'])
-                growth = self.random_growth()
+                if self.streams is None:
+                    growth = self.random_growth()
+                else:
+                    growth = self.random_growth(growth_shocks[k])
                 self.world[k].power = max(self.world[k].power * (1 + growth), 1)  # cannot grow below 0
 
                 # Update power0 assessments of themselves
                 power = self.world[k].power
-                power0 = power * np.random.normal(loc=1, scale=self.config['misperception_sigma'])
+                if self.streams is None:
+                    error = np.random.normal(loc=1, scale=self.config['misperception_sigma'])
+                else:
+                    error = 1 + self.config['misperception_sigma'] * perception_shocks[k]
+                power0 = power * error
                 self.world[k].power0 = power0
+        self.below_threshold = {}
 
         self.draw_borders(self.network)
+        self.record_power()
 
-        # Record distribution of power
-        power_dist = np.array([i.power for i in self.world.values()])
+        logger.info('Turn ended')
+
+    def record_power(self, power_dist=None):
+        """ Records the distribution of power at the end of the turn to the
+        system data set; power_dist, the power of every state, is read from
+        the world if not given.
+        """
+        if power_dist is None:
+            power_dist = np.array([i.power for i in self.world.values()])
         power_record = {'turn': self.turn,
                         'n': len(self.world),
                         'min': np.min(power_dist),
@@ -298,13 +498,15 @@ class InternationalSystem(object):
                         'sd': np.std(power_dist)}
         self.system.append(power_record)
 
-        logger.info('Turn ended')
-
-    def random_growth(self):
-        """ Cauchy distribution with barriers at -30 and 15 percent.
+    def random_growth(self, shock=None):
+        """ Cauchy distribution with barriers at -30 and 15 percent. If a
+        standard Cauchy shock is given, it is used instead of a new draw.
         """
-        growth = cauchy.rvs(size=1, loc=self.config['growth_mu'],
-                            scale=self.config['growth_sigma'])[0]
+        if shock is None:
+            growth = cauchy.rvs(size=1, loc=self.config['growth_mu'],
+                                scale=self.config['growth_sigma'])[0]
+        else:
+            growth = self.config['growth_mu'] + self.config['growth_sigma'] * shock
         if growth < -0.30:
             return -0.30
         elif growth > 0.15:
@@ -322,7 +524,7 @@ class InternationalSystem(object):
         standard deviation specified in the config file. Does not permit power
         to fall below one.
         """
-        power_init = np.random.normal(loc=self.config['power_dist_mu'],
+        power_init = self.random('power').normal(loc=self.config['power_dist_mu'],
                                       scale=self.config['power_dist_sigma'])
         power = max(power_init, 1)
         return power
@@ -340,6 +542,34 @@ class InternationalSystem(object):
         states = [k for k in self.world.keys()]
         total_power = sum([self.world[i].power for i in states])
         power_dist = [self.world[i].power / total_power for i in states]
-        random_state = np.random.choice(states, 1, power_dist)[0]
+        random_state = self.random('initiative').choice(states, 1, power_dist)[0]
 
         return self.world[random_state]
+
+    def random(self, source):
+        """ Returns the random stream for source -- power, perception,
+        initiative or war. Outside CRN mode this is numpy's global one.
+        """
+        return np.random if self.streams is None else getattr(self.streams, source)
+
+    def random_states(self, n):
+        """ Returns up to n distinct states drawn at random from the world,
+        for turns with several initiating states. Each state is equally
+        likely to be drawn, which is what random_state does in practice,
+        since its power shares are passed to np.random.choice as replace.
+        """
+        states = [k for k in self.world.keys()]
+        n = min(n, len(states))
+        random_states = self.random('initiative').choice(states, n, replace=False)
+
+        return [self.world[k] for k in random_states]
+
+    def participants(self, a, b):
+        """ Returns the names of all states that can take part in an
+        encounter between a and b: the two states and everything bordering
+        either of them, from which their allies are recruited.
+        """
+        names = set([a.name, b.name])
+        names.update(i.name for i in a.border)
+        names.update(i.name for i in b.border)
+        return names
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+import logging
+import os
+import tempfile
+
+import networkx as nx
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class WorldTemplates(object):
+    """ Cache of world maps -- the random regular graphs states are placed
+    on -- keyed by network_p, network_n and map seed, so that a sweep
+    generates each topology once. Configs share a map through their map_seed,
+    which defaults to their seed.
+
+    A map is stored as an (m, 2) array of its borders. Arrays are kept in a
+    bounded in-memory LRU cache and, if a directory is given, written there
+    as .npy files, which are loaded memory-mapped and read-only so that
+    workers on the same machine share the pages.
+
+    Attributes
+    ----------
+    directory : str or None
+        where maps are stored on disk; None keeps them in memory only
+    max_size : int
+        maximum number of maps held in memory
+    max_files : int or None
+        maximum number of maps kept on disk; least recently used are deleted.
+        Each process prunes the maps it knows of -- those on disk when it
+        started and those it has used since -- so workers sharing a directory
+        may briefly exceed it
+    """
+
+    def __init__(self, directory=None, max_size=64, max_files=1024):
+        self.directory = directory
+        self.max_size = max_size
+        self.max_files = max_files
+        self.cache = OrderedDict()
+        # Maps on disk, least recently used first, so that pruning does not
+        # list the directory
+        self.files = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            paths = [os.path.join(directory, f) for f in os.listdir(directory)
+                     if f.endswith('.npy')]
+            paths.sort(key=os.path.getmtime)
+            for path in paths:
+                self.files[os.path.basename(path)[:-len('.npy')]] = None
+
+    def key(self, network_p, network_n, seed):
+        return 'rrg_p%s_n%s_s%s' % (network_p, network_n, seed)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.npy')
+
+    def borders(self, network_p, network_n, seed):
+        """ Returns the (m, 2) array of borders of the map, generating it with
+        networkx only if it is neither in memory nor on disk.
+        """
+        key = self.key(network_p, network_n, seed)
+
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return self.cache[key]
+
+        if self.directory is not None and os.path.exists(self.path(key)):
+            borders = np.load(self.path(key), mmap_mode='r')
+            os.utime(self.path(key))
+            self.files[key] = None
+            self.files.move_to_end(key)
+            self.hits += 1
+        else:
+            borders = generate_borders(network_p, network_n, seed)
+            if self.directory is not None:
+                self.save(key, borders)
+            self.misses += 1
+
+        self.cache[key] = borders
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+
+        return borders
+
+    def save(self, key, borders):
+        """ Writes a map to disk atomically, so that concurrent workers never
+        read a partial file.
+        """
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, borders)
+        os.replace(tmp, self.path(key))
+        self.files[key] = None
+        self.files.move_to_end(key)
+        self.prune()
+
+    def prune(self):
+        """ Deletes the least recently used maps on disk beyond max_files.
+        """
+        if self.max_files is None:
+            return
+        while len(self.files) > self.max_files:
+            key, _ = self.files.popitem(last=False)
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+
+    def network(self, network_p, network_n, seed):
+        """ Returns a new, mutable networkx graph of the map.
+        """
+        return build_network(network_n,
+                             self.borders(network_p, network_n, seed))
+
+
+def generate_borders(network_p, network_n, seed):
+    """ Generates a random regular map and returns its borders as an (m, 2)
+    array.
+    """
+    network = nx.random_regular_graph(network_p, network_n, seed=seed)
+    return np.array(list(network.edges()), dtype=np.int32).reshape(-1, 2)
+
+
+def build_network(network_n, borders):
+    """ Builds the networkx graph of a map from its borders. States are
+    numbered 0 to network_n - 1.
+    """
+    network = nx.Graph()
+    network.add_nodes_from(range(network_n))
+    network.add_edges_from(np.asarray(borders).tolist())
+    return network
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from statesim.sim import Simulation
+
+logger = logging.getLogger(__name__)
+
+# Statistical equivalence of simulation engines. Optimized code paths draw
+# random numbers in a different order than the reference Simulation.run, so
+# their runs cannot be compared bit for bit; instead, the distributions of
+# the outcomes the analysis relies on are compared over many seeds.
+
+
+def reference(config):
+    """ The reference engine: runs Simulation.run on config.
+    """
+    sim = Simulation(config=config)
+    sim.run()
+    return sim
+
+
+def outcomes(sim):
+    """ Returns the outcomes of a finished simulation that engines are
+    compared on: state lifetimes with censoring flags, number of wars,
+    whether it ended in a universal empire, and the final dispersion of
+    power (coefficient of variation).
+    """
+    world = sim.world
+    deaths = [i['survived_to'] for i in world.state]
+    survivors = len(world.world)
+    power = np.array([i.power for i in world.world.values()])
+    return {'lifetimes': deaths + [world.turn] * survivors,
+            'events': [True] * len(deaths) + [False] * survivors,
+            'wars': sum(1 for i in world.wars if i['war']),
+            'universal_empire': survivors == 1,
+            'dispersion': np.std(power) / np.mean(power)}
+
+
+def _run(args):
+    engine, config = args
+    return outcomes(engine(config))
+
+
+def run_engine(engine, config, seeds, workers=1):
+    """ Runs engine, a function of a config returning a finished Simulation,
+    on config with each seed. Returns the pooled outcomes: arrays of state
+    lifetimes and censoring flags over all runs, and per-run wars, universal
+    empires and dispersion. With workers above 1, engine must be picklable.
+    """
+    args = [(engine, dict(config, seed=seed)) for seed in seeds]
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            runs = pool.map(_run, args)
+    else:
+        runs = [_run(i) for i in args]
+
+    results = {}
+    for k in ['lifetimes', 'events']:
+        results[k] = np.concatenate([r[k] for r in runs])
+    for k in ['wars', 'universal_empire', 'dispersion']:
+        results[k] = np.array([r[k] for r in runs])
+    return results
+
+
+def logrank(t1, e1, t2, e2):
+    """ Log-rank test of two samples of right-censored lifetimes t, with e
+    True where the lifetime ended in death. Returns the chi-squared statistic
+    and its p-value.
+    """
+    t = np.concatenate([t1, t2])
+    e = np.concatenate([e1, e2]).astype(bool)
+    group = np.concatenate([np.zeros(len(t1)), np.ones(len(t2))])
+
+    times, ix = np.unique(t, return_inverse=True)
+    deaths = np.bincount(ix, weights=e, minlength=len(times))
+    deaths1 = np.bincount(ix, weights=e & (group == 0), minlength=len(times))
+    leaving = np.bincount(ix, minlength=len(times))
+    leaving1 = np.bincount(ix, weights=group == 0, minlength=len(times))
+
+    # Number at risk at each time: everyone whose lifetime is at least as long
+    at_risk = leaving[::-1].cumsum()[::-1]
+    at_risk1 = leaving1[::-1].cumsum()[::-1]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        expected1 = deaths * at_risk1 / at_risk
+        var = deaths * (at_risk1 / at_risk) * (1 - at_risk1 / at_risk) * \
+            (at_risk - deaths) / (at_risk - 1)
+    var = np.nansum(var)
+    if var <= 0:
+        return 0.0, 1.0
+    chi2 = (deaths1.sum() - expected1.sum()) ** 2 / var
+    return float(chi2), float(stats.chi2.sf(chi2, 1))
+
+
+def compare(a, b, alpha=0.01):
+    """ Tests whether two engines' pooled outcomes, as returned by
+    run_engine, come from the same distributions: a log-rank test of state
+    lifetimes, Mann-Whitney and Kolmogorov-Smirnov tests of war counts, a
+    Fisher exact test of the frequency of universal empires, and a
+    Kolmogorov-Smirnov test of power dispersion.
+
+    Returns a DataFrame with one row per test. A test passes if its p-value
+    is above alpha, Bonferroni-corrected for the number of tests.
+    """
+    rows = []
+
+    chi2, p = logrank(a['lifetimes'], a['events'], b['lifetimes'], b['events'])
+    rows.append(('lifetimes', 'logrank', chi2, p,
+                 np.mean(a['lifetimes']), np.mean(b['lifetimes'])))
+
+    u, p = stats.mannwhitneyu(a['wars'], b['wars'], alternative='two-sided')
+    rows.append(('wars', 'mannwhitney', u, p,
+                 np.mean(a['wars']), np.mean(b['wars'])))
+
+    d, p = stats.ks_2samp(a['wars'], b['wars'])
+    rows.append(('wars', 'ks', d, p,
+                 np.mean(a['wars']), np.mean(b['wars'])))
+
+    table = [[a['universal_empire'].sum(), (~a['universal_empire']).sum()],
+             [b['universal_empire'].sum(), (~b['universal_empire']).sum()]]
+    odds, p = stats.fisher_exact(table)
+    rows.append(('universal_empire', 'fisher', odds, p,
+                 np.mean(a['universal_empire']), np.mean(b['universal_empire'])))
+
+    d, p = stats.ks_2samp(a['dispersion'], b['dispersion'])
+    rows.append(('dispersion', 'ks', d, p,
+                 np.mean(a['dispersion']), np.mean(b['dispersion'])))
+
+    results = pd.DataFrame(rows, columns=['outcome', 'test', 'statistic', 'p',
+                                          'reference', 'candidate'])
+    results['passed'] = results['p'] > alpha / len(results)
+    return results
+
+
+def equivalence(candidate, config, seeds, candidate_seeds=None,
+                engine=reference, alpha=0.01, workers=1):
+    """ Runs the reference engine and a candidate engine on config over many
+    seeds and compares the distributions of their outcomes. The candidate
+    uses candidate_seeds if given, so that it can be checked against the
+    reference on independent runs. Returns the table of compare().
+    """
+    candidate_seeds = seeds if candidate_seeds is None else candidate_seeds
+    a = run_engine(engine, config, seeds, workers)
+    b = run_engine(candidate, config, candidate_seeds, workers)
+    results = compare(a, b, alpha)
+    logger.info('Equivalence: %s of %s tests passed'
+                % (results['passed'].sum(), len(results)))
+    return results
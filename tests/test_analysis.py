@@ -0,0 +1,147 @@
+# python -m unittest discover -v
+
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from statesim import analysis
+from statesim.analysis import (final_turns, fit_by_config, fit_exponential,
+                               fit_weibull, kaplan_meier, load_lifetimes,
+                               weibull_regression)
+from statesim.budget import Budget
+from statesim.sweep import make_dirs, run_config
+from statesim.validation import outcomes
+
+config = {'seed': 1804,
+          'niter': 60,
+          'network_n': 20,
+          'network_p': 4,
+          'power_dist_mu': 10.0,
+          'power_dist_sigma': 3.33,
+          'misperception_sigma': 0.2,
+          'victory_sigma': 1.0,
+          'max_war_cost': 0.25,
+          'war_cost_disp': 0.125,
+          'reparations': 0.2,
+          'growth_mu': 0.03,
+          'growth_sigma': 0.01,
+          'versailles': True}
+
+
+class TestLoad(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        make_dirs(self.dir)
+        self.sims = {}
+        # Runs out of turns, ends in a universal empire, is cancelled
+        for seed, niter, budget in [(1, 60, None), (2, 400, None),
+                                    (3, 400, Budget(max_turns=30))]:
+            sim_id = 'test_%06d' % seed
+            self.sims[sim_id] = run_config(dict(config, seed=seed, niter=niter),
+                                           sim_id, output_dir=self.dir,
+                                           budget=budget)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_lifetimes(self):
+        configs, states, systems = load_lifetimes(self.dir)
+        self.assertEqual(sorted(configs.index), sorted(self.sims))
+        self.assertEqual(configs.loc['test_000003', 'turns'],
+                         self.sims['test_000003'].world.turn)
+
+        for sim_id, sim in self.sims.items():
+            expected = outcomes(sim)
+            lifetimes = states[states['sim_id'] == sim_id]
+            self.assertEqual(sorted(lifetimes['time']), sorted(expected['lifetimes']))
+            self.assertEqual(lifetimes['event'].sum(), sum(expected['events']))
+
+            system = systems.set_index('sim_id').loc[sim_id]
+            self.assertEqual(system['time'], sim.world.turn)
+            self.assertEqual(system['event'], expected['universal_empire'])
+
+    def test_fit_by_config(self):
+        configs, states, systems = load_lifetimes(self.dir)
+        for by, n in [('niter', 2), (['niter'], 2), (['niter', 'seed'], 3)]:
+            fits = fit_by_config(states, configs, by)
+            self.assertEqual(len(fits), n)
+            self.assertEqual(fits['n'].sum(), len(states))
+        self.assertEqual(list(fits['niter']), [60, 400, 400])
+        self.assertEqual(list(fits['seed']), [1, 2, 3])
+
+    def test_universal_empire_on_last_turn(self):
+        configs = pd.DataFrame({'network_n': [3, 3], 'niter': [10, 10],
+                                'cancelled': [None, None]},
+                               index=pd.Index(['a', 'b'], name='sim_id'))
+        states = pd.DataFrame({'sim_id': ['a', 'a', 'b', 'b'],
+                               'survived_to': [2, 5, 3, 9]})
+        self.assertEqual(list(final_turns(configs, states)), [6, 9])
+
+    def test_cancelled(self):
+        # The last turns of a cancelled run saw no encounter, so are not in
+        # its system data set; b was saved before turns was recorded
+        configs = pd.DataFrame({'network_n': [3, 3], 'niter': [1000, 1000],
+                                'cancelled': ['turns', 'turns'],
+                                'turns': [300, np.nan]},
+                               index=pd.Index(['a', 'b'], name='sim_id'))
+        states = pd.DataFrame({'sim_id': ['a', 'b'], 'survived_to': [250, 250]})
+        systems = pd.DataFrame({'sim_id': ['a', 'b'], 'turn': [299, 299]})
+        self.assertEqual(list(final_turns(configs, states, systems)), [300, 299])
+
+
+class TestEstimators(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(1804)
+        n = 20000
+        self.x = rng.binomial(1, 0.5, n)
+        lifetimes = np.exp(3 + 0.5 * self.x) * rng.weibull(1.5, n)
+        self.time = np.minimum(lifetimes, 40)
+        self.event = lifetimes < 40
+
+    def test_kaplan_meier(self):
+        km = kaplan_meier([1, 2, 2, 3, 4], [True, True, False, True, False])
+        self.assertEqual(list(km['at_risk']), [5, 4, 2, 1])
+        np.testing.assert_allclose(km['survival'], [0.8, 0.6, 0.3, 0.3])
+
+    def test_exponential(self):
+        fit = fit_exponential(self.time, self.event)
+        self.assertAlmostEqual(fit['rate'], self.event.sum() / self.time.sum())
+
+    def test_weibull(self):
+        fit = fit_weibull(self.time[self.x == 0], self.event[self.x == 0])
+        self.assertAlmostEqual(fit['shape'], 1.5, delta=0.05)
+        self.assertAlmostEqual(fit['scale'], np.exp(3), delta=0.5)
+
+    def test_weibull_regression(self):
+        fit = weibull_regression(self.time, self.event, pd.DataFrame({'x': self.x}))
+        self.assertAlmostEqual(fit.loc['intercept', 'coef'], 3, delta=0.05)
+        self.assertAlmostEqual(fit.loc['x', 'coef'], 0.5, delta=0.05)
+        self.assertAlmostEqual(np.exp(-fit.loc['log_sigma', 'coef']), 1.5, delta=0.05)
+
+    def test_weibull_regression_converges(self):
+        # As many lifetimes as the paper's, and a covariate with a large
+        # mean, e.g. niter: the log-likelihood is too large to get under an
+        # absolute gradient tolerance, however close the fit
+        for seed in range(3):
+            rng = np.random.RandomState(seed)
+            n = 156000
+            x = rng.binomial(1, 0.5, n)
+            niter = rng.choice([999.0, 1000.0, 1001.0], n)
+            lifetimes = np.exp(4 + 0.5 * x) * rng.weibull(1.2, n)
+            with mock.patch.object(analysis, 'logger') as log:
+                fit = weibull_regression(np.ceil(np.minimum(lifetimes, 999)),
+                                         lifetimes < 999,
+                                         pd.DataFrame({'x': x, 'niter': niter}))
+            log.warning.assert_not_called()
+            self.assertAlmostEqual(fit.loc['x', 'coef'], 0.5, delta=0.05)
+            self.assertAlmostEqual(fit.loc['niter', 'coef'], 0, delta=0.05)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+# python -m unittest discover -v
+
+import unittest
+
+from statesim.budget import Budget
+from statesim.replay import RunRecord
+from statesim.sim import Simulation
+
+config = {'seed': 1804,
+          'niter': 200,
+          'network_n': 20,
+          'network_p': 4,
+          'power_dist_mu': 10.0,
+          'power_dist_sigma': 3.33,
+          'misperception_sigma': 0.2,
+          'victory_sigma': 1.0,
+          'max_war_cost': 0.25,
+          'war_cost_disp': 0.125,
+          'reparations': 0.2,
+          'growth_mu': 0.03,
+          'growth_sigma': 0.01,
+          'versailles': True}
+
+
+class TestBudget(unittest.TestCase):
+
+    def test_turns(self):
+        sim = Simulation(config=config, budget=Budget(max_turns=30))
+        sim.run()
+        self.assertTrue(sim.cancelled.startswith('turns'))
+        self.assertEqual(sim.world.turn, 30)
+        self.assertTrue((sim.wars['turn'] <= 30).all())
+
+        # Partial runs replay up to where they were cancelled
+        world = RunRecord.from_simulation(sim).replay()
+        self.assertEqual(world.wars, sim.world.wars)
+
+    def test_time(self):
+        sim = Simulation(config=config, budget=Budget(max_seconds=0))
+        sim.run()
+        self.assertTrue(sim.cancelled.startswith('time'))
+        self.assertEqual(sim.world.turn, 0)
+
+    def test_within_budget(self):
+        sim = Simulation(config=config, budget=Budget(max_seconds=600,
+                                                      max_memory_mb=1024))
+        sim.run()
+        self.assertIsNone(sim.cancelled)
@@ -0,0 +1,54 @@
+# python -m unittest discover -v
+
+import unittest
+
+import numpy as np
+
+from statesim.crn import paired_configs, paired_difference
+from statesim.sim import Simulation
+
+config = {'seed': 1804,
+          'niter': 60,
+          'network_n': 20,
+          'network_p': 4,
+          'power_dist_mu': 10.0,
+          'power_dist_sigma': 3.33,
+          'misperception_sigma': 0.2,
+          'victory_sigma': 1.0,
+          'max_war_cost': 0.25,
+          'war_cost_disp': 0.125,
+          'reparations': 0.2,
+          'growth_mu': 0.03,
+          'growth_sigma': 0.01,
+          'versailles': True}
+
+
+class TestCRN(unittest.TestCase):
+
+    def run_pair(self, param, values):
+        pair = paired_configs(config, param, values, [1804])[0]
+        sims = []
+        for c in pair:
+            sim = Simulation(config=c)
+            sim.run()
+            sims.append(sim)
+        return sims
+
+    def test_aligned_initial_world(self):
+        a, b = self.run_pair('versailles', [True, False])
+        self.assertEqual(a.world.system[0], b.world.system[0])
+
+    def test_same_config_same_run(self):
+        a, b = self.run_pair('reparations', [0.2, 0.2])
+        self.assertEqual(a.world.wars, b.world.wars)
+
+    def test_paired_difference(self):
+        d = paired_difference([1, 2, 3, 4], [2, 3, 4, 6])
+        self.assertEqual(d['n'], 4)
+        self.assertAlmostEqual(d['diff'], 1.25)
+        self.assertTrue(d['lower'] < d['diff'] < d['upper'])
+
+    def test_single_pair(self):
+        d = paired_difference([1], [3])
+        self.assertEqual(d['diff'], 2)
+        self.assertTrue(np.isnan(d['p']))
@@ -0,0 +1,64 @@
+# python -m unittest discover -v
+
+import unittest
+
+from statesim.sim import Simulation, run_branches
+
+config = {'seed': 1804,
+          'niter': 80,
+          'network_n': 20,
+          'network_p': 4,
+          'power_dist_mu': 10.0,
+          'power_dist_sigma': 3.33,
+          'misperception_sigma': 0.2,
+          'victory_sigma': 1.0,
+          'max_war_cost': 0.25,
+          'war_cost_disp': 0.125,
+          'reparations': 0.2,
+          'growth_mu': 0.03,
+          'growth_sigma': 0.01,
+          'versailles': True}
+
+
+class TestFork(unittest.TestCase):
+
+    def setUp(self):
+        self.sim = Simulation(config=config)
+        self.steps = self.sim.steps()
+        for turn in self.steps:
+            if turn == 30:
+                break
+
+    def test_fork_continues_run(self):
+        branch = self.sim.fork()
+        self.assertIs(branch.world.network, self.sim.world.network)
+
+        # Interleave the two, to check they keep their own random streams
+        next(self.steps)
+        branch.run()
+        for turn in self.steps:
+            pass
+
+        full = Simulation(config=config)
+        full.run()
+        self.assertEqual(branch.world.wars, full.world.wars)
+        self.assertEqual(self.sim.world.wars, full.world.wars)
+        self.assertEqual(sorted(branch.world.network.edges()),
+                         sorted(full.world.network.edges()))
+
+    def test_overrides(self):
+        branch = self.sim.fork(overrides={'versailles': False}, seed=1)
+        branch.run()
+        self.assertFalse(branch.world.config['versailles'])
+        self.assertTrue(self.sim.config['versailles'])
+        self.assertEqual(branch.world.wars[:len(self.sim.world.wars)],
+                         self.sim.world.wars)
+        self.assertEqual(branch.forked['turn'], 30)
+
+    def test_run_branches(self):
+        branches = run_branches(self.sim, [({'reparations': 0.1}, 1),
+                                           ({'reparations': 0.3}, 1)],
+                                workers=2)
+        self.assertEqual([b.config['reparations'] for b in branches], [0.1, 0.3])
+        self.assertTrue(all(b.world.turn > 30 for b in branches))
+        self.assertEqual(self.sim.world.turn, 30)
@@ -0,0 +1,84 @@
+# python -m unittest discover -v
+
+import unittest
+
+from statesim.partition import PartitionedSimulation, partition_regions
+
+config = {'seed': 1804,
+          'niter': 60,
+          'network_n': 40,
+          'network_p': 4,
+          'power_dist_mu': 10.0,
+          'power_dist_sigma': 3.33,
+          'misperception_sigma': 0.2,
+          'victory_sigma': 1.0,
+          'max_war_cost': 0.25,
+          'war_cost_disp': 0.125,
+          'reparations': 0.2,
+          'growth_mu': 0.03,
+          'growth_sigma': 0.01,
+          'versailles': True,
+          'concurrency': 4,
+          'regions': 3,
+          'repartition': 20}
+
+
+class TestPartition(unittest.TestCase):
+
+    def test_regions_cover_map(self):
+        sim = PartitionedSimulation(config=config)
+        next(sim.steps())
+        regions = partition_regions(sim.world.network, 3, seed=1)
+        self.assertEqual(set(regions), set(sim.world.network.nodes))
+        self.assertEqual(set(regions.values()), set(range(3)))
+
+    def test_run(self):
+        sim = PartitionedSimulation(config=config)
+        sim.run()
+        world = sim.world
+        self.assertGreater(len(world.wars), 0)
+        self.assertEqual(len(world.world) + len(world.state), config['network_n'])
+        self.assertTrue(all(i.power >= 1 for i in world.world.values()))
+        self.assertIsNone(sim.pool)
+
+        # Borders, redrawn only around conquests, match the map
+        for k, i in world.world.items():
+            border = [world.world[j] for j in world.network.neighbors(k) if j != k]
+            self.assertEqual(i.border, border)
+            self.assertEqual(len(i._alliances), 1)
+
+    def test_deterministic(self):
+        a = PartitionedSimulation(config=config)
+        a.run()
+        b = PartitionedSimulation(config=config, workers=2)
+        b.run()
+        self.assertEqual(a.world.wars, b.world.wars)
+
+    def test_fork(self):
+        sim = PartitionedSimulation(config=config, workers=2)
+        steps = sim.steps()
+        for turn in steps:
+            if turn == 20:
+                break
+        branch = sim.fork()
+        self.assertIsInstance(branch, PartitionedSimulation)
+        self.assertEqual(branch.workers, 2)
+
+        branch.run()
+        for turn in steps:
+            pass
+        self.assertEqual(branch.world.wars, sim.world.wars)
+
+    def test_requires_concurrency(self):
+        sim = PartitionedSimulation(config=dict(config, concurrency=1))
+        with self.assertRaises(ValueError):
+            sim.run()
+
+    def test_rejects_crn(self):
+        sim = PartitionedSimulation(config=dict(config, crn=True))
+        with self.assertRaises(ValueError):
+            sim.run()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+# python -m unittest discover -v
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from statesim.queue import WorkQueue
+
+
+class TestWorkQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'queue.sqlite')
+        self.queue = WorkQueue(self.path, lease_timeout=60)
+        self.configs = [{'seed': i, 'niter': 10} for i in range(5)]
+        self.queue.enqueue(self.configs)
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.dir)
+
+    def test_enqueue_once(self):
+        added = self.queue.enqueue(self.configs)
+        self.assertEqual(added, 0)
+        self.assertEqual(self.queue.counts()['pending'], 5)
+
+    def test_claim_disjoint(self):
+        other = WorkQueue(self.path)
+        a = self.queue.claim('a', 3)
+        b = other.claim('b', 3)
+        other.close()
+        self.assertEqual(len(a), 3)
+        self.assertEqual(len(b), 2)
+        self.assertEqual(set(i for i, _ in a) & set(i for i, _ in b), set())
+
+    def test_expired_lease_requeued(self):
+        claimed = self.queue.claim('dead', 5)
+        self.queue.requeue_expired(now=1e12)
+        reclaimed = self.queue.claim('alive', 5)
+        self.assertEqual(len(reclaimed), 5)
+
+        # The dead worker has lost its lease and cannot report
+        self.assertFalse(self.queue.complete(claimed[0][0], 'dead'))
+        self.assertTrue(self.queue.complete(reclaimed[0][0], 'alive', {'n': 1}))
+        self.assertEqual(self.queue.counts()['done'], 1)
+
+    def test_max_attempts(self):
+        for attempt in range(3):
+            claimed = self.queue.claim('crashing', 5)
+            self.assertEqual(len(claimed), 5)
+            self.queue.requeue_expired(now=1e12)
+
+        # Each config has crashed three workers and is not handed out again
+        self.assertEqual(self.queue.claim('next', 5), [])
+        self.assertEqual(self.queue.counts()['failed'], 5)
@@ -0,0 +1,60 @@
+# python -m unittest discover -v
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from statesim.replay import RunRecord
+from statesim.sim import Simulation
+
+config = {'seed': 1804,
+          'niter': 60,
+          'network_n': 20,
+          'network_p': 4,
+          'power_dist_mu': 10.0,
+          'power_dist_sigma': 3.33,
+          'misperception_sigma': 0.2,
+          'victory_sigma': 1.0,
+          'max_war_cost': 0.25,
+          'war_cost_disp': 0.125,
+          'reparations': 0.2,
+          'growth_mu': 0.03,
+          'growth_sigma': 0.01,
+          'versailles': True}
+
+
+class TestRunRecord(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.sim = Simulation(config=config)
+        self.sim.run()
+        path = os.path.join(self.dir, 'run.npz')
+        RunRecord.from_simulation(self.sim).save(path)
+        self.record = RunRecord.load(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_replay_end(self):
+        world = self.record.replay()
+        self.assertEqual(world.wars, self.sim.world.wars)
+        self.assertEqual(sorted(world.world), sorted(self.sim.world.world))
+
+    def test_replay_turn(self):
+        world = self.record.replay(turn=20)
+        self.assertEqual(world.turn, 20)
+        self.assertEqual(world.system, self.sim.world.system[:len(world.system)])
+
+    def test_trajectories(self):
+        trajectories = list(self.record.trajectories())
+        self.assertEqual(trajectories[0][0], 0)
+        self.assertEqual(len(trajectories[0][1]), 20)
+        final = {k: v.power for k, v in self.sim.world.world.items()}
+        self.assertEqual(trajectories[-1][1], final)
+
+    def test_divergence(self):
+        self.record.log['outcome'][0] = 3
+        with self.assertRaises(ValueError):
+            self.record.replay()
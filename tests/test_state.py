@@ -1,5 +1,6 @@
 # python -m unittest discover -v
 
+import pickle
 import unittest
 
 from statesim.state import State
@@ -50,3 +51,63 @@ class TestState(unittest.TestCase):
         self.assertEqual(new_allies, expected)
 
 
+
+
+class TestAlliance(unittest.TestCase):
+
+    def setUp(self):
+        self.state1 = State(name=1, power=10, misperception=0)
+        self.state2 = State(name=2, power=5, misperception=0)
+        self.state3 = State(name=3, power=6, misperception=0)
+
+    def test_total_power(self):
+        self.state1.alliance.append(self.state2)
+        self.state2.alliance.append(self.state1)
+        self.assertEqual(self.state1.alliance.power, 15)
+
+        # Power changes reach every alliance the state is in
+        self.state2.power = 1
+        self.assertEqual(self.state1.alliance.power, 11)
+        self.assertEqual(self.state2.alliance.power, 11)
+
+    def test_reset(self):
+        self.state1.alliance = [self.state1, self.state3]
+        self.assertEqual(self.state1.alliance.power, 16)
+        self.state1.alliance = [self.state1]
+        self.state3.power = 100
+        self.assertEqual(self.state1.alliance.power, 10)
+        self.assertEqual(self.state3._alliances, [self.state3.alliance])
+
+    def test_list_methods(self):
+        alliance = self.state1.alliance
+        states = [self.state1, self.state2, self.state3]
+
+        def check():
+            self.assertAlmostEqual(alliance.power, sum(i.power for i in alliance))
+            for i in states:
+                self.assertEqual(sum(a is alliance for a in i._alliances),
+                                 sum(j is i for j in alliance))
+
+        for change in [lambda a: a.insert(0, self.state2),
+                       lambda a: a.remove(self.state2),
+                       lambda a: a.extend([self.state2, self.state3]),
+                       lambda a: a.pop(),
+                       lambda a: a.__setitem__(1, self.state3),
+                       lambda a: a.__setitem__(slice(0, 1), [self.state2, self.state1]),
+                       lambda a: a.__delitem__(0),
+                       lambda a: a.__imul__(2),
+                       lambda a: a.__delitem__(slice(1, None)),
+                       lambda a: a.clear(),
+                       lambda a: a.__imul__(0)]:
+            change(alliance)
+            check()
+            self.state2.power += 1
+            check()
+
+    def test_pickle(self):
+        self.state1.alliance.append(self.state2)
+        state1 = pickle.loads(pickle.dumps(self.state1))
+        state2 = state1.alliance[1]
+        state2.power = 1
+        self.assertEqual(state1.alliance.power, 11)
+        self.assertEqual(len(state1.alliance), 2)
@@ -0,0 +1,64 @@
+# python -m unittest discover -v
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from statesim.sim import Simulation
+from statesim.summary import SweepSummary
+
+config = {'seed': 1804,
+          'niter': 50,
+          'network_n': 20,
+          'network_p': 4,
+          'power_dist_mu': 10.0,
+          'power_dist_sigma': 3.33,
+          'misperception_sigma': 0.2,
+          'victory_sigma': 1.0,
+          'max_war_cost': 0.25,
+          'war_cost_disp': 0.125,
+          'reparations': 0.2,
+          'growth_mu': 0.03,
+          'growth_sigma': 0.01,
+          'versailles': True}
+
+
+class TestSweepSummary(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.sims = []
+        for seed in [1, 2]:
+            sim = Simulation(config=dict(config, seed=seed))
+            sim.run()
+            self.sims.append(sim)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_replicates_pooled(self):
+        summary = SweepSummary()
+        for sim in self.sims:
+            summary.add(sim)
+        table = summary.table()
+
+        self.assertEqual(len(table), 1)
+        self.assertEqual(table['runs'][0], 2)
+        self.assertEqual(table['states'][0], 40)
+
+        s = list(summary.summaries.values())[0]
+        self.assertEqual(sum(s['lifetimes']), s['deaths'])
+        self.assertEqual(s['deaths'] + s['censored'], 40)
+        self.assertEqual(s['deaths'], sum(len(sim.state) for sim in self.sims))
+
+    def test_checkpoint_merge(self):
+        path = os.path.join(self.dir, 'summary.json')
+        a = SweepSummary(path=path, checkpoint_every=1)
+        a.add(self.sims[0])
+        b = SweepSummary()
+        b.add(self.sims[1])
+
+        loaded = SweepSummary.load(path)
+        loaded.merge(b)
+        self.assertEqual(loaded.table()['runs'][0], 2)
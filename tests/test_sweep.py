@@ -0,0 +1,168 @@
+# python -m unittest discover -v
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from statesim.queue import WorkQueue
+from statesim.sweep import Heartbeat, expand_sweep, shard, work, work_processes
+
+base = {'seed': 1804, 'niter': 500, 'versailles': True}
+spec = {'replicates': 2,
+        'grid': {'reparations': [0.1, 0.2, 0.3],
+                 'versailles': [True, False]}}
+
+config = {'seed': 1804,
+          'niter': 200,
+          'network_n': 20,
+          'network_p': 4,
+          'power_dist_mu': 10.0,
+          'power_dist_sigma': 3.33,
+          'misperception_sigma': 0.2,
+          'victory_sigma': 1.0,
+          'max_war_cost': 0.25,
+          'war_cost_disp': 0.125,
+          'reparations': 0.2,
+          'growth_mu': 0.03,
+          'growth_sigma': 0.01,
+          'versailles': True}
+
+
+class TestSweep(unittest.TestCase):
+
+    def test_expand(self):
+        configs = expand_sweep(base, spec)
+        self.assertEqual(len(configs), 12)
+        self.assertEqual(configs[0]['niter'], 500)
+        self.assertEqual(len(set(c['seed'] for c in configs)), 12)
+        self.assertEqual(configs, expand_sweep(base, spec))
+
+    def test_maps(self):
+        configs = expand_sweep(base, dict(spec, maps=5))
+        self.assertEqual(len(set(c['map_seed'] for c in configs)), 5)
+        self.assertEqual([c['seed'] for c in configs],
+                         [c['seed'] for c in expand_sweep(base, spec)])
+
+    def test_shards_partition(self):
+        configs = expand_sweep(base, spec)
+        shards = [shard(configs, i, 5) for i in range(5)]
+        numbers = sorted(i for s in shards for i, _ in s)
+        self.assertEqual(numbers, list(range(12)))
+
+    def test_shard_out_of_range(self):
+        with self.assertRaises(ValueError):
+            shard([], 3, 3)
+
+
+class TestWork(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'queue.sqlite')
+        configs = [dict(config, seed=i) for i in range(4)]
+        # Missing a parameter, so the simulation raises
+        broken = dict(config, seed=4)
+        del broken['victory_sigma']
+        queue = WorkQueue(self.path)
+        queue.enqueue(configs + [broken])
+        queue.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_work(self):
+        # Leases far shorter than a batch, while another worker keeps
+        # requeueing expired work: without the heartbeat, the worker would
+        # lose the rest of its batch while running the first config
+        stopped = threading.Event()
+
+        def other_worker():
+            queue = WorkQueue(self.path, lease_timeout=0.3)
+            while not stopped.wait(0.05):
+                queue.requeue_expired()
+            queue.close()
+
+        other = threading.Thread(target=other_worker)
+        other.start()
+        output_dir = os.path.join(self.dir, 'data')
+        try:
+            n = work(self.path, 'worker', output_dir=output_dir, batch_size=5,
+                     lease_timeout=0.3, poll=0.1)
+        finally:
+            stopped.set()
+            other.join()
+        self.assertEqual(n, 5)
+
+        queue = WorkQueue(self.path)
+        self.assertEqual(queue.counts()['done'], 4)
+        failed = queue.results('failed')
+        attempts = queue.conn.execute('SELECT attempts FROM tasks').fetchall()
+        queue.close()
+        self.assertEqual(len(failed), 1)
+        self.assertNotIn('victory_sigma', failed[0][0])
+        self.assertEqual(attempts, [(1,)] * 5)
+
+        self.assertEqual(sorted(os.listdir(os.path.join(output_dir, 'state'))),
+                         ['state_queue_%06d.csv' % i for i in range(1, 5)])
+        self.assertEqual(os.listdir(os.path.join(output_dir, 'error')),
+                         ['config_queue_000005.json'])
+
+    def test_rerun(self):
+        # A config requeued while its first worker still ran it, and run
+        # again by another worker, overwrites the outputs of the first run
+        output_dir = os.path.join(self.dir, 'data')
+        work(self.path, 'first', output_dir=output_dir, poll=0.1)
+        queue = WorkQueue(self.path)
+        queue.conn.execute("UPDATE tasks SET status = 'pending' WHERE id = 1")
+        queue.close()
+
+        self.assertEqual(work(self.path, 'second', output_dir=output_dir, poll=0.1), 1)
+        self.assertEqual(len(os.listdir(os.path.join(output_dir, 'config'))), 4)
+        self.assertEqual(len(os.listdir(os.path.join(output_dir, 'state'))), 4)
+
+    def test_work_processes(self):
+        output_dir = os.path.join(self.dir, 'data')
+        summary = os.path.join(self.dir, 'summary.json')
+        n = work_processes(self.path, 'worker', workers=2, summary_path=summary,
+                           output_dir=output_dir, poll=0.1)
+        self.assertEqual(n, 5)
+
+        queue = WorkQueue(self.path)
+        workers = queue.conn.execute('SELECT DISTINCT worker FROM tasks').fetchall()
+        self.assertEqual(queue.counts()['done'], 4)
+        queue.close()
+        self.assertLessEqual(set(workers), {('worker-0',), ('worker-1',)})
+        self.assertTrue(os.path.exists(os.path.join(self.dir, 'summary_worker-0.json')))
+        self.assertTrue(os.path.exists(os.path.join(self.dir, 'summary_worker-1.json')))
+
+
+class TestHeartbeat(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'queue.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_locked(self):
+        # The heartbeat carries on after the database is locked once
+        calls = []
+
+        def heartbeat(queue, worker_id):
+            calls.append(worker_id)
+            if len(calls) == 1:
+                raise sqlite3.OperationalError('database is locked')
+
+        with mock.patch.object(WorkQueue, 'heartbeat', heartbeat):
+            thread = Heartbeat(self.path, 'worker', 0.01)
+            thread.start()
+            time.sleep(0.2)
+            thread.stop()
+            thread.join()
+        self.assertGreater(len(calls), 1)
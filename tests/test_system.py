@@ -2,6 +2,9 @@
 
 import unittest
 
+import numpy as np
+
+from statesim.sim import Simulation
 from statesim.state import State
 from statesim.system import InternationalSystem
 
@@ -38,4 +41,90 @@ class TestSystem(unittest.TestCase):
     def test_lv_3(self):
         self.state2.alliance.append(self.state1)
         lv = self.world.likelihood_victory(self.state3, self.state2)
-        self.assertEqual(0.39826457168679225, lv)
\ No newline at end of file
+        self.assertEqual(0.39826457168679225, lv)
+
+class TestWarDamageBatch(unittest.TestCase):
+    """ A batch of one war must be assessed exactly like the serial path."""
+
+    def setUp(self):
+        batch_config = dict(config, versailles=True)
+        np.random.seed(1804)
+        self.serial = InternationalSystem(config=batch_config)
+        np.random.seed(1804)
+        self.batch = InternationalSystem(config=batch_config)
+
+    def fight(self, world):
+        a = world.world[0]
+        b = a.border[0]
+        a.power, b.power = 12.0, 4.0
+        a.alliance.append(a.border[1])
+        np.random.seed(1804)
+        return world.war(a, b)
+
+    def test_batch_matches_serial(self):
+        self.serial.assess_war_damage(self.fight(self.serial))
+        self.batch.assess_war_damage_batch([self.fight(self.batch)])
+
+        serial_power = [self.serial.world[k].power for k in self.serial.world]
+        batch_power = [self.batch.world[k].power for k in self.batch.world]
+        np.testing.assert_allclose(serial_power, batch_power)
+
+
+class TestDeathIndex(unittest.TestCase):
+    """ Deaths are indexed from the states that fought, then removed."""
+
+    def test_index(self):
+        world = InternationalSystem(config=dict(config, versailles=True))
+        a = world.world[0]
+        b = a.border[0]
+        a.power, b.power = 1000.0, 1.0
+        np.random.seed(1804)
+        war = world.war(a, b)
+        world.assess_war_damage(war)
+        self.assertEqual(list(world.below_threshold), [b.name])
+        self.assertIs(b.conquered, war['victor'])
+
+        world.end_turn()
+        self.assertEqual(world.below_threshold, {})
+        self.assertNotIn(b.name, world.world)
+        self.assertEqual(world.state[-1]['state_id'], b.name)
+
+    def test_dead_alliances_detached(self):
+        sim = Simulation(config=dict(config, niter=150, versailles=True))
+        sim.run()
+        self.assertGreater(len(sim.world.state), 0)
+
+        # Alliances are reset at the end of every turn: each survivor counts
+        # only towards its own, not towards those of its dead allies
+        for i in sim.world.world.values():
+            self.assertEqual(len(i._alliances), 1)
+            self.assertIs(i._alliances[0], i.alliance)
+
+
+class TestConcurrentTurn(unittest.TestCase):
+    """ Concurrent turns resolve several encounters with disjoint participants."""
+
+    def test_run(self):
+        sim = Simulation(config=dict(config, niter=60, concurrency=8, versailles=True))
+        encounters = {}
+        encounter = sim.encounter
+
+        # Record each encounter's participants, as they stand when it starts
+        def record(state, target):
+            participants = sim.world.participants(state, target)
+            encounters.setdefault(sim.world.turn, []).append(participants)
+            return encounter(state, target)
+
+        sim.encounter = record
+        sim.run()
+
+        self.assertGreater(max(len(i) for i in encounters.values()), 1)
+        for turn in encounters.values():
+            involved = set()
+            for participants in turn:
+                self.assertEqual(participants & involved, set())
+                involved |= participants
+
+        world = sim.world
+        self.assertEqual(len(world.world) + len(world.state), config['network_n'])
+        self.assertEqual(len(world.wars), sum(len(i) for i in encounters.values()))
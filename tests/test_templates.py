@@ -0,0 +1,74 @@
+# python -m unittest discover -v
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from statesim.system import InternationalSystem
+from statesim.templates import WorldTemplates, build_network, generate_borders
+
+config = {'seed': 1804,
+          'niter': 500,
+          'network_n': 20,
+          'network_p': 4,
+          'power_dist_mu': 10.0,
+          'power_dist_sigma': 3.33,
+          'misperception_sigma': 0.2,
+          'victory_sigma': 1.0,
+          'max_war_cost': 0.25,
+          'war_cost_disp': 0.125,
+          'reparations': 0.2,
+          'growth_mu': 0.03,
+          'growth_sigma': 0.01}
+
+
+class TestWorldTemplates(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_same_map(self):
+        templates = WorldTemplates(directory=self.dir)
+        cached = templates.network(8, 98, 1804)
+        generated = build_network(98, generate_borders(8, 98, 1804))
+        self.assertEqual(list(cached.edges()), list(generated.edges()))
+
+    def test_generated_once(self):
+        templates = WorldTemplates(directory=self.dir, max_size=1)
+        templates.borders(4, 20, 1)
+        templates.borders(4, 20, 2)
+
+        # Evicted from memory, but read back from disk memory-mapped
+        borders = templates.borders(4, 20, 1)
+        self.assertEqual(templates.misses, 2)
+        self.assertIsInstance(borders, np.memmap)
+
+        # A fresh cache, as in another worker, shares the files
+        other = WorldTemplates(directory=self.dir)
+        other.borders(4, 20, 2)
+        self.assertEqual(other.misses, 0)
+
+    def test_max_files(self):
+        templates = WorldTemplates(directory=self.dir, max_files=2)
+        for seed in range(4):
+            templates.borders(4, 20, seed)
+        self.assertEqual(list(templates.files), [templates.key(4, 20, 2),
+                                                 templates.key(4, 20, 3)])
+        self.assertEqual(len(os.listdir(self.dir)), 2)
+
+        other = WorldTemplates(directory=self.dir)
+        other.borders(4, 20, 0)
+        self.assertEqual(other.misses, 1)
+
+    def test_map_seed(self):
+        templates = WorldTemplates(directory=self.dir)
+        a = InternationalSystem(dict(config, seed=1, map_seed=7), templates=templates)
+        b = InternationalSystem(dict(config, seed=2, map_seed=7), templates=templates)
+        self.assertEqual(templates.misses, 1)
+        self.assertEqual(list(a.network.edges()), list(b.network.edges()))
@@ -0,0 +1,46 @@
+# python -m unittest discover -v
+
+import unittest
+
+from statesim.sim import Simulation
+from statesim.validation import equivalence
+
+config = {'seed': 1804,
+          'niter': 50,
+          'network_n': 20,
+          'network_p': 4,
+          'power_dist_mu': 10.0,
+          'power_dist_sigma': 3.33,
+          'misperception_sigma': 0.2,
+          'victory_sigma': 1.0,
+          'max_war_cost': 0.25,
+          'war_cost_disp': 0.125,
+          'reparations': 0.2,
+          'growth_mu': 0.03,
+          'growth_sigma': 0.01,
+          'versailles': True}
+
+
+def crn(config):
+    """ Same model, different order of random draws."""
+    sim = Simulation(config=dict(config, crn=True))
+    sim.run()
+    return sim
+
+
+def ruinous(config):
+    """ A different model: far costlier wars."""
+    sim = Simulation(config=dict(config, max_war_cost=0.9, reparations=0.6))
+    sim.run()
+    return sim
+
+
+class TestEquivalence(unittest.TestCase):
+
+    def test_equivalent(self):
+        results = equivalence(crn, config, range(15), range(100, 115))
+        self.assertTrue(results['passed'].all())
+
+    def test_not_equivalent(self):
+        results = equivalence(ruinous, config, range(15), range(100, 115))
+        self.assertFalse(results['passed'].all())